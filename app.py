@@ -1,24 +1,505 @@
-from flask import Flask, render_template, request, redirect, send_file, session, url_for, flash
-import sqlite3, os, io, csv
+import time
+_T_INICIO_IMPORTACION = time.perf_counter()   # para medir el arranque en frío
+
+from flask import Flask, render_template, request, redirect, send_file, session, url_for, flash, g
+from flask import Response, stream_with_context, send_from_directory, has_app_context, jsonify
+from markupsafe import Markup, escape
+import sqlite3, os, io, csv, threading, hashlib, json, re, tempfile, zlib, gzip, secrets
+import multiprocessing, unicodedata, codecs, fcntl
+import click
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, ExitStack
 from datetime import datetime, timedelta, date
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from textwrap import wrap
+from types import SimpleNamespace
 
 APP_DIR = os.path.dirname(__file__)
-DB = os.path.join(APP_DIR, "data.db")
+DB = os.environ.get("INTENCIONES_DB", os.path.join(APP_DIR, "data.db"))
 
 app = Flask(__name__)
-app.secret_key = "CAMBIAR_POR_ALGO_SEGURO"
+
+
+def _clave_secreta():
+    # SECRET_KEY del entorno; si no está, una clave aleatoria guardada junto a
+    # la base de datos: la comparten todos los workers y sobrevive reinicios
+    # (con una clave distinta por worker las sesiones se perderían).
+    clave = os.environ.get("SECRET_KEY")
+    if clave:
+        return clave
+
+    ruta = os.environ.get("SECRET_KEY_FILE",
+                          os.path.join(os.path.dirname(os.path.abspath(DB)), ".secret_key"))
+    if not os.path.exists(ruta):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ruta))
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(tmp, ruta)   # falla si otro worker la creó primero
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+    with open(ruta) as f:
+        return f.read().strip()
+
+
+app.secret_key = _clave_secreta()
 
 # ============================================================
 #  FUNCIONES BASE DE BASE DE DATOS
 # ============================================================
 
-def get_db():
-    conn = sqlite3.connect(DB)
+# Ajustes de conexión para varios funcionarios escribiendo a la vez:
+# WAL permite que los lectores no bloqueen a quien escribe (y viceversa).
+DB_BUSY_TIMEOUT_MS = 5000
+DB_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}",
+    "PRAGMA cache_size=-8000",      # ~8 MB de caché de páginas
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+_db_local = threading.local()
+
+
+class ConexionDB:
+    """Envoltura de la conexión reutilizable del hilo.
+
+    Se comporta como sqlite3.Connection, pero close() no cierra la conexión:
+    descarta lo no confirmado y la deja lista para la siguiente petición.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def cursor(self):
+        return CursorMedido(self._conn.cursor())
+
+    def execute(self, *args):
+        with medir_sql():
+            return self._conn.execute(*args)
+
+    def executemany(self, *args):
+        with medir_sql():
+            return self._conn.executemany(*args)
+
+    def close(self):
+        if self._conn.in_transaction:
+            self._conn.rollback()
+
+
+class CursorMedido:
+    """Cursor que suma cantidad y tiempo de sentencias SQL a las métricas."""
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def execute(self, *args):
+        with medir_sql():
+            self._cur.execute(*args)
+        return self
+
+    def executemany(self, *args):
+        with medir_sql():
+            self._cur.executemany(*args)
+        return self
+
+    def fetchone(self):
+        with medir_sql(contar=False):
+            return self._cur.fetchone()
+
+    def fetchmany(self, *args):
+        with medir_sql(contar=False):
+            return self._cur.fetchmany(*args)
+
+    def fetchall(self):
+        with medir_sql(contar=False):
+            return self._cur.fetchall()
+
+
+def _abrir_conexion():
+    conn = sqlite3.connect(DB, timeout=DB_BUSY_TIMEOUT_MS / 1000)
     conn.row_factory = sqlite3.Row
+    for pragma in DB_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
+
+def _conexion_del_hilo():
+    # Una conexión por hilo y por proceso: tras un fork (gunicorn --preload)
+    # el worker no debe reutilizar la conexión heredada del proceso maestro.
+    clave = (os.getpid(), DB)
+    if getattr(_db_local, "clave", None) != clave:
+        _db_local.conn = _abrir_conexion()
+        _db_local.clave = clave
+    return _db_local.conn
+
+
+def cerrar_conexion_del_hilo():
+    """Cierra la conexión del hilo actual (el maestro de gunicorn, antes del fork)."""
+    conn = getattr(_db_local, "conn", None)
+    if conn is not None:
+        conn.close()
+    _db_local.conn = _db_local.clave = None
+
+
+def get_db():
+    conn = _conexion_del_hilo()
+    try:
+        if "db" not in g:
+            g.db = ConexionDB(conn)
+        return g.db
+    except RuntimeError:
+        # Fuera de contexto de aplicación (arranque, scripts)
+        return ConexionDB(conn)
+
+
+@app.teardown_appcontext
+def liberar_db(exc):
+    db = g.pop("db", None)
+    if db is not None:
+        db.close()
+
+# ============================================================
+#  MÉTRICAS (peticiones, SQL y fases del PDF)
+# ============================================================
+# Cada worker acumula sus métricas en memoria y cada METRICS_FLUSH_SECONDS
+# las escribe en METRICS_DIR/<pid>-<token>.json; /admin/metrics suma todos
+# los archivos, así el total cubre todos los workers de gunicorn. Los archivos
+# de workers que ya terminaron se suman en retirados.json y se borran, así el
+# directorio no crece aunque gunicorn recicle workers.
+
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(APP_DIR, "cache", "metrics"))
+METRICS_FLUSH_SECONDS = 5
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_RETIRADOS = "retirados.json"
+
+# Límites (segundos) de los histogramas de latencia
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_metricas_lock = threading.Lock()
+_metricas = {"peticiones": {}, "latencia": {}, "sql": {}, "pdf_fases": {}, "pdf_cache": {},
+             # Arranque en frío de este worker (segundos desde que empezó a importar app.py)
+             "arranque": {"inicio": time.time(), "importacion": None, "primera_peticion": None}}
+_metricas_flush = {"ultimo": 0.0, "pid": None, "archivo": None}
+
+
+def _observar(histogramas, clave, segundos):
+    h = histogramas.get(clave)
+    if h is None:
+        h = histogramas[clave] = {"buckets": [0] * len(BUCKETS_LATENCIA), "suma": 0.0, "n": 0}
+    for i, limite in enumerate(BUCKETS_LATENCIA):
+        if segundos <= limite:
+            h["buckets"][i] += 1
+    h["suma"] += segundos
+    h["n"] += 1
+
+
+@contextmanager
+def medir_sql(contar=True):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_app_context():
+            g.sql_segundos = g.get("sql_segundos", 0.0) + time.perf_counter() - t0
+            if contar:
+                g.sql_n = g.get("sql_n", 0) + 1
+
+
+@contextmanager
+def fase_pdf(nombre):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _metricas_lock:
+            _observar(_metricas["pdf_fases"], nombre, time.perf_counter() - t0)
+
+
+def contar_pdf_cache(resultado):
+    with _metricas_lock:
+        _metricas["pdf_cache"][resultado] = _metricas["pdf_cache"].get(resultado, 0) + 1
+
+
+def _ruta_actual():
+    return request.url_rule.rule if request.url_rule else "<sin ruta>"
+
+
+@app.before_request
+def iniciar_metricas():
+    g.t_inicio = time.perf_counter()
+    g.sql_n = 0
+    g.sql_segundos = 0.0
+
+
+def _registrar_peticion(estado):
+    if "t_inicio" not in g or g.get("metricas_registradas"):
+        return
+    g.metricas_registradas = True
+
+    ruta = _ruta_actual()
+    segundos = time.perf_counter() - g.t_inicio
+    clave = f"{ruta}|{request.method}|{estado}"
+
+    with _metricas_lock:
+        arranque = _metricas["arranque"]
+        if arranque["primera_peticion"] is None:
+            arranque["primera_peticion"] = time.perf_counter() - _T_INICIO_IMPORTACION
+            app.logger.info("Worker %s: importación %.3f s, primera petición %.3f s",
+                            os.getpid(), arranque["importacion"] or 0, arranque["primera_peticion"])
+        _metricas["peticiones"][clave] = _metricas["peticiones"].get(clave, 0) + 1
+        _observar(_metricas["latencia"], f"{ruta}|{request.method}", segundos)
+        sql = _metricas["sql"].setdefault(ruta, {"n": 0, "segundos": 0.0})
+        sql["n"] += g.get("sql_n", 0)
+        sql["segundos"] += g.get("sql_segundos", 0.0)
+
+    if time.monotonic() - _metricas_flush["ultimo"] > METRICS_FLUSH_SECONDS:
+        guardar_metricas()
+
+
+@app.after_request
+def registrar_metricas(resp):
+    _registrar_peticion(resp.status_code)
+    return resp
+
+
+@app.teardown_request
+def registrar_metricas_error(exc):
+    if exc is not None:
+        _registrar_peticion(500)
+
+
+def guardar_metricas():
+    _metricas_flush["ultimo"] = time.monotonic()
+    if _metricas_flush["pid"] != os.getpid():
+        # Un nombre por proceso: si el sistema recicla el pid de un worker
+        # muerto, el nuevo no pisa sus métricas antes de que se jubilen
+        _metricas_flush["pid"] = os.getpid()
+        _metricas_flush["archivo"] = f"{os.getpid()}-{secrets.token_hex(4)}.json"
+    with _metricas_lock:
+        datos = json.dumps(_metricas)
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=METRICS_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(datos)
+        os.replace(tmp, os.path.join(METRICS_DIR, _metricas_flush["archivo"]))
+    except OSError as e:
+        app.logger.warning("No se pudieron guardar las métricas: %s", e)
+
+
+def _leer_metricas(ruta):
+    try:
+        with open(ruta) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _metricas_vacias():
+    return {"peticiones": {}, "latencia": {}, "sql": {}, "pdf_fases": {}, "pdf_cache": {},
+            "arranque": None}
+
+
+def _worker_vivo(nombre):
+    m = re.match(r"\d+", nombre)
+    if not m:
+        return True   # no es de un worker: no tocarlo
+    try:
+        os.kill(int(m.group()), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _sumar_histograma(destino, h):
+    if destino is None:
+        return {"buckets": list(h["buckets"]), "suma": h["suma"], "n": h["n"]}
+    destino["buckets"] = [a + b for a, b in zip(destino["buckets"], h["buckets"])]
+    destino["suma"] += h["suma"]
+    destino["n"] += h["n"]
+    return destino
+
+
+def _sumar_metricas(total, m):
+    # Del arranque se informa el del worker más reciente
+    arranque = m.get("arranque")
+    if arranque and (total["arranque"] is None or arranque["inicio"] > total["arranque"]["inicio"]):
+        total["arranque"] = arranque
+
+    for k, v in m["peticiones"].items():
+        total["peticiones"][k] = total["peticiones"].get(k, 0) + v
+    for k, v in m["pdf_cache"].items():
+        total["pdf_cache"][k] = total["pdf_cache"].get(k, 0) + v
+    for seccion in ("latencia", "pdf_fases"):
+        for k, h in m[seccion].items():
+            total[seccion][k] = _sumar_histograma(total[seccion].get(k), h)
+    for k, v in m["sql"].items():
+        sql = total["sql"].setdefault(k, {"n": 0, "segundos": 0.0})
+        sql["n"] += v["n"]
+        sql["segundos"] += v["segundos"]
+
+
+def jubilar_metricas():
+    """Suma en retirados.json los archivos de workers que ya no existen y los borra."""
+    try:
+        candado = open(os.path.join(METRICS_DIR, ".retirados.lock"), "w")
+    except OSError:
+        return
+    with candado:
+        try:
+            fcntl.flock(candado, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return   # otro worker lo está haciendo
+
+        muertos = [e for e in os.scandir(METRICS_DIR)
+                   if e.name.endswith(".json") and e.name != METRICS_RETIRADOS
+                   and not _worker_vivo(e.name)]
+        if not muertos:
+            return
+
+        ruta = os.path.join(METRICS_DIR, METRICS_RETIRADOS)
+        retirados = _leer_metricas(ruta) or dict(_metricas_vacias(), jubilados=[])
+        # "jubilados": archivos ya sumados. Si el proceso murió entre escribir
+        # retirados.json y borrarlos, no se vuelven a sumar.
+        presentes = set(os.listdir(METRICS_DIR))
+        jubilados = [n for n in retirados["jubilados"] if n in presentes]
+        for e in muertos:
+            if e.name in jubilados:
+                continue
+            m = _leer_metricas(e.path)
+            if m:
+                _sumar_metricas(retirados, m)
+            jubilados.append(e.name)
+        retirados["jubilados"] = jubilados
+
+        fd, tmp = tempfile.mkstemp(dir=METRICS_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(retirados, f)
+        os.replace(tmp, ruta)
+        for e in muertos:
+            try:
+                os.remove(e.path)
+            except OSError:
+                pass
+
+
+def metricas_agregadas():
+    guardar_metricas()
+    jubilar_metricas()
+
+    # Primero los workers y al final retirados.json: un archivo que se jubiló
+    # mientras tanto ya está sumado ahí y se descarta (los totales no bajan)
+    workers = {}
+    for entrada in os.scandir(METRICS_DIR):
+        if entrada.name.endswith(".json") and entrada.name != METRICS_RETIRADOS:
+            m = _leer_metricas(entrada.path)
+            if m:
+                workers[entrada.name] = m
+
+    total = _metricas_vacias()
+    retirados = _leer_metricas(os.path.join(METRICS_DIR, METRICS_RETIRADOS))
+    if retirados:
+        _sumar_metricas(total, retirados)
+        for nombre in retirados["jubilados"]:
+            workers.pop(nombre, None)
+    for m in workers.values():
+        _sumar_metricas(total, m)
+    return total
+
+
+def _etiquetas(**kw):
+    partes = []
+    for k, v in kw.items():
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"')
+        partes.append(f'{k}="{v}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def _prometheus_histograma(lineas, nombre, etiquetas, h):
+    for limite, n in zip(BUCKETS_LATENCIA, h["buckets"]):
+        lineas.append(f"{nombre}_bucket{_etiquetas(**etiquetas, le=limite)} {n}")
+    lineas.append(f"{nombre}_bucket{_etiquetas(**etiquetas, le='+Inf')} {h['n']}")
+    lineas.append(f"{nombre}_sum{_etiquetas(**etiquetas)} {h['suma']:.6f}")
+    lineas.append(f"{nombre}_count{_etiquetas(**etiquetas)} {h['n']}")
+
+
+def metricas_prometheus(m):
+    lineas = [
+        "# HELP intenciones_http_requests_total Peticiones atendidas por ruta, método y estado.",
+        "# TYPE intenciones_http_requests_total counter",
+    ]
+    for clave, n in sorted(m["peticiones"].items()):
+        ruta, metodo, estado = clave.rsplit("|", 2)
+        lineas.append(f"intenciones_http_requests_total{_etiquetas(ruta=ruta, metodo=metodo, estado=estado)} {n}")
+
+    lineas += [
+        "# HELP intenciones_http_request_duration_seconds Tiempo hasta entregar la respuesta.",
+        "# TYPE intenciones_http_request_duration_seconds histogram",
+    ]
+    for clave, h in sorted(m["latencia"].items()):
+        ruta, metodo = clave.rsplit("|", 1)
+        _prometheus_histograma(lineas, "intenciones_http_request_duration_seconds",
+                               {"ruta": ruta, "metodo": metodo}, h)
+
+    lineas += [
+        "# HELP intenciones_sql_statements_total Sentencias SQL ejecutadas por ruta.",
+        "# TYPE intenciones_sql_statements_total counter",
+    ]
+    for ruta, v in sorted(m["sql"].items()):
+        lineas.append(f"intenciones_sql_statements_total{_etiquetas(ruta=ruta)} {v['n']}")
+    lineas += [
+        "# HELP intenciones_sql_seconds_total Tiempo acumulado en SQL por ruta.",
+        "# TYPE intenciones_sql_seconds_total counter",
+    ]
+    for ruta, v in sorted(m["sql"].items()):
+        lineas.append(f"intenciones_sql_seconds_total{_etiquetas(ruta=ruta)} {v['segundos']:.6f}")
+
+    lineas += [
+        "# HELP intenciones_pdf_fase_duration_seconds Duración de cada fase de generación del PDF.",
+        "# TYPE intenciones_pdf_fase_duration_seconds histogram",
+    ]
+    for fase, h in sorted(m["pdf_fases"].items()):
+        _prometheus_histograma(lineas, "intenciones_pdf_fase_duration_seconds", {"fase": fase}, h)
+
+    lineas += [
+        "# HELP intenciones_pdf_cache_total Consultas a la caché de PDF por resultado.",
+        "# TYPE intenciones_pdf_cache_total counter",
+    ]
+    for resultado, n in sorted(m["pdf_cache"].items()):
+        lineas.append(f"intenciones_pdf_cache_total{_etiquetas(resultado=resultado)} {n}")
+
+    lineas += [
+        "# HELP intenciones_arranque_segundos Arranque en frío del worker más reciente.",
+        "# TYPE intenciones_arranque_segundos gauge",
+    ]
+    for fase in ("importacion", "primera_peticion"):
+        if m["arranque"] and m["arranque"][fase] is not None:
+            lineas.append(f"intenciones_arranque_segundos{_etiquetas(fase=fase)} {m['arranque'][fase]:.6f}")
+
+    return "\n".join(lineas) + "\n"
+
 def init_db():
     conn = get_db()
     cur = conn.cursor()
@@ -70,17 +551,345 @@ def init_db():
     );
     """)
 
-    # Crear el admin si no existe
-    cur.execute("SELECT COUNT(*) as c FROM users")
-    if cur.fetchone()["c"] == 0:
-        cur.execute("INSERT INTO users(username,password,role,active) VALUES (?,?,?,1)",
-                    ("admin","admin123","admin"))
+    migrar_db(conn)
+
+    # Crear el admin si no existe (en una sola sentencia: varios workers
+    # pueden llegar aquí a la vez)
+    cur.execute("""
+        INSERT OR IGNORE INTO users(username,password,role,active)
+        SELECT ?,?,?,1 WHERE NOT EXISTS (SELECT 1 FROM users)
+    """, ("admin","admin123","admin"))
 
     conn.commit()
     conn.close()
 
-# ✅ Ejecutar init_db() siempre al arrancar (compatible Flask 3)
-init_db()
+# ============================================================
+#  MIGRACIONES DE ESQUEMA
+# ============================================================
+# Cada migración es (versión, [sentencias]). La versión aplicada se guarda en
+# PRAGMA user_version, así un data.db existente se actualiza al arrancar.
+# Nunca modificar una migración ya publicada: agregar una nueva al final.
+
+MIGRACIONES = [
+    # 1: llaves foráneas en intenciones (SQLite exige reconstruir la tabla)
+    (1, [
+        """
+        CREATE TABLE intenciones_nueva (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            misa_id INTEGER REFERENCES misas(id),
+            categoria_id INTEGER REFERENCES categorias(id),
+            ofrece TEXT,
+            intencion_base_id INTEGER REFERENCES intencion_base(id),
+            peticiones TEXT,
+            fecha_creado TEXT,
+            fecha_actualizado TEXT,
+            funcionario_id INTEGER REFERENCES users(id) ON DELETE SET NULL
+        )
+        """,
+        """
+        INSERT INTO intenciones_nueva(
+            id, misa_id, categoria_id, ofrece, intencion_base_id,
+            peticiones, fecha_creado, fecha_actualizado, funcionario_id
+        )
+        SELECT id, misa_id, categoria_id, ofrece, intencion_base_id,
+               peticiones, fecha_creado, fecha_actualizado, funcionario_id
+        FROM intenciones
+        """,
+        "DROP TABLE intenciones",
+        "ALTER TABLE intenciones_nueva RENAME TO intenciones",
+    ]),
+
+    # 2: índices para las consultas frecuentes
+    (2, [
+        "CREATE INDEX IF NOT EXISTS idx_intenciones_misa ON intenciones(misa_id)",
+        "CREATE INDEX IF NOT EXISTS idx_intenciones_funcionario_fecha ON intenciones(funcionario_id, fecha_creado)",
+        "CREATE INDEX IF NOT EXISTS idx_intenciones_categoria ON intenciones(categoria_id)",
+        "CREATE INDEX IF NOT EXISTS idx_intenciones_int_base ON intenciones(intencion_base_id)",
+        "CREATE INDEX IF NOT EXISTS idx_misas_fecha ON misas(fecha)",
+    ]),
+
+    # 3: hora de la misa en minutos desde medianoche, para ordenar con índice
+    (3, [
+        "ALTER TABLE misas ADD COLUMN minutos INTEGER",
+        """
+        UPDATE misas SET minutos = (
+            CASE
+                WHEN CAST(substr(hora,1,2) AS INTEGER) >= 13 THEN CAST(substr(hora,1,2) AS INTEGER)
+                WHEN ampm = 'AM' AND substr(hora,1,2) = '12' THEN 0
+                WHEN ampm = 'PM' AND substr(hora,1,2) != '12' THEN CAST(substr(hora,1,2) AS INTEGER) + 12
+                ELSE CAST(substr(hora,1,2) AS INTEGER)
+            END
+        ) * 60 + CAST(substr(hora,4,2) AS INTEGER)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_misas_fecha_minutos ON misas(fecha, minutos)",
+        "DROP INDEX IF EXISTS idx_misas_fecha",
+    ]),
+
+    # 4: cola de trabajos en segundo plano (PDF, exportación, purga)
+    (4, [
+        """
+        CREATE TABLE IF NOT EXISTS trabajos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            parametros TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'pendiente',
+            hechas INTEGER NOT NULL DEFAULT 0,
+            total INTEGER,
+            mensaje TEXT,
+            archivo TEXT,
+            usuario_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+            intentos INTEGER NOT NULL DEFAULT 0,
+            creado TEXT NOT NULL,
+            iniciado TEXT,
+            latido TEXT,
+            terminado TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos(estado, id)",
+    ]),
+
+    # 5: búsqueda de texto completo sobre ofrece y peticiones. Índice FTS5 con
+    # contenido externo (no duplica el texto), sin tildes (NIÑO = NINO) y
+    # mantenido por triggers.
+    (5, [
+        """
+        CREATE VIRTUAL TABLE intenciones_fts USING fts5(
+            ofrece, peticiones,
+            content='intenciones', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """,
+        """
+        CREATE TRIGGER intenciones_fts_ai AFTER INSERT ON intenciones BEGIN
+            INSERT INTO intenciones_fts(rowid, ofrece, peticiones)
+            VALUES (new.id, new.ofrece, new.peticiones);
+        END
+        """,
+        """
+        CREATE TRIGGER intenciones_fts_ad AFTER DELETE ON intenciones BEGIN
+            INSERT INTO intenciones_fts(intenciones_fts, rowid, ofrece, peticiones)
+            VALUES ('delete', old.id, old.ofrece, old.peticiones);
+        END
+        """,
+        """
+        CREATE TRIGGER intenciones_fts_au AFTER UPDATE OF ofrece, peticiones ON intenciones BEGIN
+            INSERT INTO intenciones_fts(intenciones_fts, rowid, ofrece, peticiones)
+            VALUES ('delete', old.id, old.ofrece, old.peticiones);
+            INSERT INTO intenciones_fts(rowid, ofrece, peticiones)
+            VALUES (new.id, new.ofrece, new.peticiones);
+        END
+        """,
+        "INSERT INTO intenciones_fts(intenciones_fts) VALUES ('rebuild')",
+    ]),
+
+    # 6: nombres frecuentes para autocompletar "ofrece" y "peticiones".
+    # clave = nombre normalizado (sin tildes); la llave primaria sirve para
+    # buscar por prefijo. Se llena con lo ya registrado.
+    (6, [
+        """
+        CREATE TABLE nombres_frecuentes (
+            campo TEXT NOT NULL,
+            clave TEXT NOT NULL,
+            nombre TEXT NOT NULL,
+            usos INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (campo, clave)
+        ) WITHOUT ROWID
+        """,
+        lambda conn: llenar_nombres_frecuentes(conn),
+    ]),
+
+    # 7: horarios recurrentes de misas. Antes del índice único (fecha, hora,
+    # ampm) se unen las misas repetidas: sus intenciones pasan a la primera.
+    (7, [
+        """
+        UPDATE intenciones SET misa_id = (
+            SELECT MIN(d.id) FROM misas m
+            JOIN misas d ON d.fecha = m.fecha AND d.hora = m.hora AND d.ampm = m.ampm
+            WHERE m.id = intenciones.misa_id
+        )
+        WHERE misa_id IN (
+            SELECT m.id FROM misas m
+            JOIN misas d ON d.fecha = m.fecha AND d.hora = m.hora AND d.ampm = m.ampm AND d.id < m.id
+        )
+        """,
+        """
+        DELETE FROM misas WHERE EXISTS (
+            SELECT 1 FROM misas d
+            WHERE d.fecha = misas.fecha AND d.hora = misas.hora AND d.ampm = misas.ampm
+              AND d.id < misas.id
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_misas_unica ON misas(fecha, hora, ampm)",
+        """
+        CREATE TABLE IF NOT EXISTS horarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dia_semana INTEGER NOT NULL,    -- 0 = lunes ... 6 = domingo
+            hora TEXT NOT NULL,
+            ampm TEXT NOT NULL,
+            minutos INTEGER NOT NULL,
+            desde TEXT NOT NULL,
+            hasta TEXT                      -- NULL: sin fecha final
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS horarios_excepciones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fecha TEXT NOT NULL,
+            horario_id INTEGER REFERENCES horarios(id) ON DELETE CASCADE  -- NULL: todos
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_horarios_excepciones_fecha ON horarios_excepciones(fecha)",
+    ]),
+]
+
+
+def minutos_misa(hora, ampm):
+    """Minutos desde medianoche de una misa ("HH:MM" + AM/PM).
+
+    Misma regla que la migración 3: si la hora ya viene en 24 h (13 o más)
+    se respeta; si no, AM/PM decide.
+    """
+    hh, mm = int(hora[:2]), int(hora[3:5])
+    if hh < 13:
+        if ampm == "AM" and hh == 12:
+            hh = 0
+        elif ampm == "PM" and hh != 12:
+            hh += 12
+    return hh * 60 + mm
+
+
+def migrar_db(conn):
+    if conn.in_transaction:
+        conn.commit()
+
+    for version, sentencias in MIGRACIONES:
+        # foreign_keys solo se puede cambiar fuera de una transacción
+        conn.execute("PRAGMA foreign_keys=OFF")
+        try:
+            # BEGIN IMMEDIATE: si varios workers arrancan a la vez, solo uno migra
+            conn.execute("BEGIN IMMEDIATE")
+            actual = conn.execute("PRAGMA user_version").fetchone()[0]
+            if actual >= version:
+                conn.commit()
+                continue
+
+            for sql in sentencias:
+                # Algunas migraciones necesitan Python (p. ej. normalizar texto)
+                if callable(sql):
+                    sql(conn)
+                else:
+                    conn.execute(sql)
+
+            fallas = conn.execute("PRAGMA foreign_key_check").fetchall()
+            if fallas:
+                app.logger.warning("Migración %s: %s filas con referencias rotas",
+                                   version, len(fallas))
+
+            conn.execute(f"PRAGMA user_version={version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("PRAGMA foreign_keys=ON")
+
+# ============================================================
+#  INICIALIZACIÓN DEL ESQUEMA
+# ============================================================
+# Importar app.py no toca la base de datos. El esquema se crea/actualiza con
+#     flask --app app init-db
+# una vez por despliegue; si no se hizo, el primer request de cada worker lo
+# hace (init_db es idempotente y cada migración corre con BEGIN IMMEDIATE).
+
+_esquema = {"listo": False}
+_esquema_lock = threading.Lock()
+
+
+def esquema_al_dia(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    return version >= MIGRACIONES[-1][0]
+
+
+@app.cli.command("init-db")
+def init_db_comando():
+    """Crea las tablas y aplica las migraciones pendientes."""
+    init_db()
+    print(f"Base de datos lista: {DB} (versión {MIGRACIONES[-1][0]})")
+
+
+@app.before_request
+def asegurar_esquema():
+    if _esquema["listo"]:
+        return
+    with _esquema_lock:
+        if not _esquema["listo"]:
+            if not esquema_al_dia(get_db()):
+                init_db()
+            _esquema["listo"] = True
+
+# ============================================================
+#  CACHÉ DE DATOS DE REFERENCIA (categorías, frases, settings)
+# ============================================================
+# Estas tablas cambian pocas veces al año. Cada worker guarda una copia en
+# memoria junto con settings.version_referencia; toda escritura sobre ellas
+# incrementa esa versión (invalidar_referencia) y los workers recargan en su
+# siguiente petición.
+
+_referencia = {"version": None}
+_referencia_lock = threading.Lock()
+
+
+def invalidar_referencia(cur):
+    cur.execute("""
+        INSERT INTO settings(key,value) VALUES ('version_referencia','1')
+        ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+    """)
+
+
+def guardar_setting(cur, clave, valor):
+    cur.execute("INSERT OR REPLACE INTO settings(key,value) VALUES (?,?)", (clave, valor))
+    invalidar_referencia(cur)
+
+
+def referencia():
+    global _referencia
+
+    if "referencia" in g:
+        return g.referencia
+
+    cur = get_db().cursor()
+    cur.execute("SELECT value FROM settings WHERE key='version_referencia'")
+    row = cur.fetchone()
+    version = row["value"] if row else "0"
+
+    datos = _referencia
+    if datos["version"] != version:
+        with _referencia_lock:
+            datos = _referencia
+            if datos["version"] != version:
+                cur.execute("SELECT * FROM categorias ORDER BY orden")
+                categorias = cur.fetchall()
+
+                cur.execute("SELECT * FROM intencion_base ORDER BY frase")
+                frases = cur.fetchall()
+
+                cur.execute("SELECT key, value FROM settings")
+                settings = {r["key"]: r["value"] for r in cur.fetchall()}
+
+                datos = {
+                    "version": version,
+                    "categorias": categorias,
+                    "categorias_activas": [c for c in categorias if c["active"] == 1],
+                    "categorias_por_id": {c["id"]: c for c in categorias},
+                    "frases": frases,
+                    "frases_activas": [b for b in frases if b["active"] == 1],
+                    "settings": settings,
+                }
+                _referencia = datos
+    cur.close()
+
+    g.referencia = datos
+    return datos
 
 # ============================================================
 #  DECORADOR LOGIN
@@ -139,63 +948,100 @@ def index():
 #  PANEL DE ADMINISTRACIÓN
 # ============================================================
 
+ADMIN_POR_PAGINA = 50
+
 @app.route("/admin")
 @login_required(role="admin")
 def admin():
     section = request.args.get("section")
 
-    conn = get_db(); cur = conn.cursor()
-
-    # Usuarios
-    cur.execute("SELECT * FROM users ORDER BY username")
-    users = cur.fetchall()
-
-    # Misas
-    cur.execute("""
-    SELECT *
-    FROM misas
-    ORDER BY 
-        fecha ASC,
-        CAST(
-            CASE
-                WHEN ampm = 'AM' AND substr(hora,1,2) = '12' THEN 0
-                WHEN ampm = 'PM' AND substr(hora,1,2) != '12' THEN CAST(substr(hora,1,2) AS INTEGER) + 12
-                ELSE CAST(substr(hora,1,2) AS INTEGER)
-            END
-        AS INTEGER),
-        CAST(substr(hora,4,2) AS INTEGER)
-    """)
-    misas = cur.fetchall()
-
-    # Categorías
-    cur.execute("SELECT * FROM categorias ORDER BY orden")
-    categorias = cur.fetchall()
+    # Solo se consulta lo que muestra la sección pedida
+    datos = {
+        "users": [],
+        "misas": [],
+        "categorias": [],
+        "frases": [],
+        "texto_global": "",
+        "last_deletion": "Nunca",
+        "filtros": {},
+        "pagina": 1,
+        "hay_siguiente": False,
+    }
 
-    # Frases base
-    cur.execute("SELECT * FROM intencion_base ORDER BY frase")
-    frases = cur.fetchall()
+    try:
+        pagina = max(1, int(request.args.get("pagina", 1)))
+    except ValueError:
+        pagina = 1
+    datos["pagina"] = pagina
+    offset = (pagina - 1) * ADMIN_POR_PAGINA
+
+    if section == "usuarios":
+        q = request.args.get("q", "").strip()
+        conn = get_db(); cur = conn.cursor()
+        cur.execute("""
+            SELECT * FROM users
+            WHERE username LIKE ?
+            ORDER BY username
+            LIMIT ? OFFSET ?
+        """, (f"%{q}%", ADMIN_POR_PAGINA + 1, offset))
+        users = cur.fetchall()
+        conn.close()
 
-    # Configuración
-    cur.execute("SELECT value FROM settings WHERE key='pdf_texto_global'")
-    row = cur.fetchone()
-    texto_global = row["value"] if row else ""
+        datos["hay_siguiente"] = len(users) > ADMIN_POR_PAGINA
+        datos["users"] = users[:ADMIN_POR_PAGINA]
+        datos["filtros"] = {"q": q}
 
-    cur.execute("SELECT value FROM settings WHERE key='last_deletion'")
-    row = cur.fetchone()
-    last_deletion = row["value"] if row else "Nunca"
+    elif section == "misas":
+        # Por defecto: misas desde hoy en adelante
+        desde = request.args.get("desde") or date.today().isoformat()
+        hasta = request.args.get("hasta") or "9999-12-31"
+        conn = get_db(); cur = conn.cursor()
+        cur.execute("""
+            SELECT * FROM misas
+            WHERE fecha >= ? AND fecha <= ?
+            ORDER BY fecha, minutos
+            LIMIT ? OFFSET ?
+        """, (desde, hasta, ADMIN_POR_PAGINA + 1, offset))
+        misas = cur.fetchall()
+        conn.close()
 
-    conn.close()
+        datos["hay_siguiente"] = len(misas) > ADMIN_POR_PAGINA
+        datos["misas"] = misas[:ADMIN_POR_PAGINA]
+        datos["filtros"] = {"desde": desde, "hasta": request.args.get("hasta", "")}
+
+    # Categorías, frases base y configuración (caché de referencia)
+    elif section == "categorias":
+        datos["categorias"] = referencia()["categorias"]
+    elif section == "frases":
+        datos["frases"] = referencia()["frases"]
+    elif section == "config":
+        datos["texto_global"] = referencia()["settings"].get("pdf_texto_global", "")
+    elif section == "delete":
+        datos["last_deletion"] = referencia()["settings"].get("last_deletion", "Nunca")
+    elif section == "archivo":
+        datos["archivo_hasta"] = archivo_hasta()
+        datos["archivar_sugerido"] = inicio_de_mes_hace(ARCHIVO_MESES).isoformat()
+        datos["archivos"] = [{
+            "anio": a,
+            "nombre": os.path.basename(ruta_archivo(a)),
+            "mb": round(os.path.getsize(ruta_archivo(a)) / 1e6, 1),
+        } for a in anios_archivo()]
+    elif section == "horarios":
+        conn = get_db(); cur = conn.cursor()
+        cur.execute("SELECT * FROM horarios ORDER BY dia_semana, minutos")
+        datos["horarios"] = cur.fetchall()
+        cur.execute("""
+            SELECT e.*, h.dia_semana, h.hora, h.ampm FROM horarios_excepciones e
+            LEFT JOIN horarios h ON h.id = e.horario_id
+            WHERE e.fecha >= ?
+            ORDER BY e.fecha
+        """, (date.today().isoformat(),))
+        datos["excepciones"] = cur.fetchall()
+        conn.close()
+        datos["dias_semana"] = DIAS_SEMANA
+        datos["hoy"] = date.today().isoformat()
 
-    return render_template(
-        "admin/dashboard.html",
-        section=section,
-        users=users,
-        misas=misas,
-        categorias=categorias,
-        frases=frases,
-        texto_global=texto_global,
-        last_deletion=last_deletion
-    )
+    return render_template("admin/dashboard.html", section=section, **datos)
 
 
 # ============================================================
@@ -294,6 +1140,12 @@ def admin_delete_user(user_id):
         conn.close()
         return redirect("/admin")
 
+    # el archivo histórico no tiene ON DELETE SET NULL: sus intenciones lo siguen nombrando
+    if en_uso_en_archivo("funcionario_id", user_id):
+        flash("❌ No se puede eliminar: tiene intenciones en el archivo histórico. Puede inactivarlo.")
+        conn.close()
+        return redirect("/admin")
+
     # eliminar (solo funcionarios)
     cur.execute("DELETE FROM users WHERE id=?", (user_id,))
     conn.commit()
@@ -314,23 +1166,20 @@ def admin_create_misa():
     hora = request.form["hora"]
     ampm = request.form["ampm"]
 
-    # Convertir formato 4 dígitos a HH:MM
-    h = hora.strip()
-
-    if len(h) == 4 and h.isdigit():
-        # Ejemplo: 0700 → 07:00
-        h = h[:2] + ":" + h[2:]
-
-    try:
-        dt = datetime.strptime(h, "%H:%M")
-        hora_24 = dt.strftime("%H:%M")
-    except:
+    hora_24 = hora_formulario(hora)
+    if not hora_24:
         flash("❌ Formato de hora inválido. Use 4 números (ej: 0700).")
         return redirect("/admin")
 
     conn = get_db()
     cur = conn.cursor()
-    cur.execute("INSERT INTO misas(fecha,hora,ampm) VALUES (?,?,?)", (fecha, hora_24, ampm))
+    try:
+        cur.execute("INSERT INTO misas(fecha,hora,ampm,minutos) VALUES (?,?,?,?)",
+                    (fecha, hora_24, ampm, minutos_misa(hora_24, ampm)))
+    except sqlite3.IntegrityError:
+        conn.close()
+        flash(f"⚠️ Ya existe una misa el {fecha} a las {hora_24} {ampm}.")
+        return redirect("/admin")
     conn.commit()
     conn.close()
     
@@ -347,12 +1196,228 @@ def admin_delete_misa(misa_id):
     if cur.fetchone()["c"] > 0:
         flash("❌ No se puede eliminar: hay intenciones asociadas.")
     else:
+        cur.execute("SELECT * FROM misas WHERE id=?", (misa_id,))
+        misa = cur.fetchone()
         cur.execute("DELETE FROM misas WHERE id=?", (misa_id,))
+        if misa:
+            # Si la creó un horario, que la generación diaria no la vuelva a crear
+            excepcion_por_misa(cur, misa)
         conn.commit()
 
     conn.close()
     return redirect("/admin")
 
+# ============================================================
+#  HORARIOS DE MISAS (recurrentes)
+# ============================================================
+# "Seis misas cada domingo y dos entre semana": cada horario es un día de la
+# semana con su hora y vigencia. generar_misas crea las misas de un rango con
+# un solo executemany; el índice único (fecha, hora, ampm) hace que las que ya
+# existen se ignoren, así que se puede repetir sin duplicar. Cada worker la
+# corre una vez al día (hilo vigilante) para los próximos
+# HORARIOS_HORIZONTE_DIAS; también `flask --app app generar-misas`.
+# Las excepciones (un horario, o todos, en una fecha) no generan misa.
+
+DIAS_SEMANA = ["LUNES", "MARTES", "MIÉRCOLES", "JUEVES", "VIERNES", "SÁBADO", "DOMINGO"]
+HORARIOS_HORIZONTE_DIAS = int(os.environ.get("HORARIOS_HORIZONTE_DIAS", "60"))
+HORARIOS_RANGO_MAX_DIAS = 366
+
+_horarios = {"dia": None}
+
+
+def hora_formulario(texto):
+    """"0700" o "07:00" -> "07:00"; None si no es una hora válida."""
+    h = texto.strip()
+
+    if len(h) == 4 and h.isdigit():
+        # Ejemplo: 0700 → 07:00
+        h = h[:2] + ":" + h[2:]
+
+    try:
+        return datetime.strptime(h, "%H:%M").strftime("%H:%M")
+    except ValueError:
+        return None
+
+
+def generar_misas(cur, desde, hasta):
+    """Crea las misas de los horarios entre `desde` y `hasta` (date); devuelve cuántas nuevas."""
+    d1, d2 = desde.isoformat(), hasta.isoformat()
+    cur.execute("""
+        SELECT * FROM horarios
+        WHERE desde <= ? AND (hasta IS NULL OR hasta >= ?)
+    """, (d2, d1))
+    por_dia = {}
+    for h in cur.fetchall():
+        por_dia.setdefault(h["dia_semana"], []).append(h)
+
+    cur.execute("SELECT fecha, horario_id FROM horarios_excepciones WHERE fecha >= ? AND fecha <= ?",
+                (d1, d2))
+    excepciones = {(r["fecha"], r["horario_id"]) for r in cur.fetchall()}
+
+    filas = []
+    dia = desde
+    while dia <= hasta:
+        fecha = dia.isoformat()
+        if (fecha, None) not in excepciones:
+            for h in por_dia.get(dia.weekday(), []):
+                if (h["desde"] <= fecha and (h["hasta"] is None or fecha <= h["hasta"])
+                        and (fecha, h["id"]) not in excepciones):
+                    filas.append((fecha, h["hora"], h["ampm"], h["minutos"]))
+        dia += timedelta(days=1)
+
+    if not filas:
+        return 0
+    cur.executemany("INSERT OR IGNORE INTO misas(fecha,hora,ampm,minutos) VALUES (?,?,?,?)", filas)
+    return cur.rowcount
+
+
+def generar_misas_del_dia(conn):
+    # Desde el hilo vigilante: una vez al día por worker (es idempotente)
+    hoy = date.today()
+    if _horarios["dia"] == hoy:
+        return
+    cur = conn.cursor()
+    nuevas = generar_misas(cur, hoy, hoy + timedelta(days=HORARIOS_HORIZONTE_DIAS))
+    cur.close()
+    conn.commit()
+    _horarios["dia"] = hoy
+    if nuevas:
+        app.logger.info("Horarios: %s misas nuevas hasta %s días adelante",
+                        nuevas, HORARIOS_HORIZONTE_DIAS)
+
+
+def excepcion_por_misa(cur, misa):
+    cur.execute("""
+        INSERT INTO horarios_excepciones(fecha, horario_id)
+        SELECT ?, id FROM horarios
+        WHERE dia_semana=? AND hora=? AND ampm=? AND desde <= ? AND (hasta IS NULL OR hasta >= ?)
+    """, (misa["fecha"], date.fromisoformat(misa["fecha"]).weekday(), misa["hora"], misa["ampm"],
+          misa["fecha"], misa["fecha"]))
+
+
+@app.cli.command("generar-misas")
+@click.option("--dias", default=HORARIOS_HORIZONTE_DIAS, show_default=True,
+              help="días hacia adelante desde hoy")
+def generar_misas_comando(dias):
+    """Crea las misas de los horarios recurrentes (se puede correr cada noche)."""
+    conn = get_db()
+    cur = conn.cursor()
+    hoy = date.today()
+    nuevas = generar_misas(cur, hoy, hoy + timedelta(days=dias))
+    conn.commit()
+    print(f"{nuevas} misas nuevas hasta {hoy + timedelta(days=dias)}")
+
+
+@app.route("/admin/horarios/create", methods=["POST"])
+@login_required(role="admin")
+def admin_create_horario():
+    dias = [int(d) for d in request.form.getlist("dia_semana") if d.isdigit() and int(d) < 7]
+    hora = hora_formulario(request.form["hora"])
+    ampm = request.form["ampm"]
+    desde = request.form.get("desde") or date.today().isoformat()
+    hasta = request.form.get("hasta") or None
+
+    if not dias:
+        flash("❌ Seleccione al menos un día de la semana.")
+        return redirect("/admin?section=horarios")
+    if not hora:
+        flash("❌ Formato de hora inválido. Use 4 números (ej: 0700).")
+        return redirect("/admin?section=horarios")
+    if hasta and hasta < desde:
+        flash("❌ La fecha final debe ser posterior a la inicial.")
+        return redirect("/admin?section=horarios")
+
+    conn = get_db(); cur = conn.cursor()
+    cur.executemany("""
+        INSERT INTO horarios(dia_semana, hora, ampm, minutos, desde, hasta) VALUES (?,?,?,?,?,?)
+    """, [(d, hora, ampm, minutos_misa(hora, ampm), desde, hasta) for d in dias])
+
+    hoy = date.today()
+    nuevas = generar_misas(cur, hoy, hoy + timedelta(days=HORARIOS_HORIZONTE_DIAS))
+    conn.commit()
+    conn.close()
+
+    flash(f"✅ Horario guardado. {nuevas} misas creadas para los próximos {HORARIOS_HORIZONTE_DIAS} días.")
+    return redirect("/admin?section=horarios")
+
+
+@app.route("/admin/horarios/delete/<int:horario_id>")
+@login_required(role="admin")
+def admin_delete_horario(horario_id):
+    # Las misas ya creadas se conservan (pueden tener intenciones)
+    conn = get_db(); cur = conn.cursor()
+    cur.execute("DELETE FROM horarios WHERE id=?", (horario_id,))
+    conn.commit()
+    conn.close()
+
+    flash("✅ Horario eliminado. Las misas ya creadas se conservan.")
+    return redirect("/admin?section=horarios")
+
+
+@app.route("/admin/horarios/excepcion", methods=["POST"])
+@login_required(role="admin")
+def admin_create_excepcion():
+    fecha = request.form["fecha"]
+    horario_id = int(request.form["horario_id"]) if request.form.get("horario_id") else None
+
+    conn = get_db(); cur = conn.cursor()
+    cur.execute("INSERT INTO horarios_excepciones(fecha, horario_id) VALUES (?,?)", (fecha, horario_id))
+
+    # Quitar las misas ya generadas para esa fecha, salvo las que tienen intenciones
+    cur.execute("""
+        SELECT DISTINCT m.id, (SELECT COUNT(*) FROM intenciones i WHERE i.misa_id = m.id) AS n
+        FROM misas m JOIN horarios h
+          ON h.hora = m.hora AND h.ampm = m.ampm AND h.dia_semana = ?
+        WHERE m.fecha = ? AND (? IS NULL OR h.id = ?)
+    """, (date.fromisoformat(fecha).weekday(), fecha, horario_id, horario_id))
+    misas = cur.fetchall()
+    vacias = [(m["id"],) for m in misas if m["n"] == 0]
+    cur.executemany("DELETE FROM misas WHERE id=?", vacias)
+    conn.commit()
+    conn.close()
+
+    mensaje = f"✅ Excepción guardada para el {fecha}."
+    if vacias:
+        mensaje += f" Se eliminaron {len(vacias)} misas sin intenciones."
+    if len(vacias) < len(misas):
+        mensaje += f" ⚠️ {len(misas) - len(vacias)} misas tienen intenciones y se conservaron."
+    flash(mensaje)
+    return redirect("/admin?section=horarios")
+
+
+@app.route("/admin/horarios/excepcion/delete/<int:excepcion_id>")
+@login_required(role="admin")
+def admin_delete_excepcion(excepcion_id):
+    conn = get_db(); cur = conn.cursor()
+    cur.execute("DELETE FROM horarios_excepciones WHERE id=?", (excepcion_id,))
+    conn.commit()
+    conn.close()
+
+    flash("✅ Excepción eliminada. Las misas se crearán en la próxima generación.")
+    return redirect("/admin?section=horarios")
+
+
+@app.route("/admin/horarios/generar", methods=["POST"])
+@login_required(role="admin")
+def admin_generar_misas():
+    try:
+        desde = date.fromisoformat(request.form["desde"])
+        hasta = date.fromisoformat(request.form["hasta"])
+    except ValueError:
+        flash("❌ Fechas inválidas.")
+        return redirect("/admin?section=horarios")
+    if hasta < desde or (hasta - desde).days >= HORARIOS_RANGO_MAX_DIAS:
+        flash(f"❌ El rango debe ser de 1 a {HORARIOS_RANGO_MAX_DIAS} días.")
+        return redirect("/admin?section=horarios")
+
+    conn = get_db(); cur = conn.cursor()
+    nuevas = generar_misas(cur, desde, hasta)
+    conn.commit()
+    conn.close()
+
+    flash(f"✅ {nuevas} misas nuevas entre {desde} y {hasta}.")
+    return redirect("/admin?section=horarios")
+
 # ============================================================
 #  CRUD CATEGORÍAS
 # ============================================================
@@ -367,9 +1432,10 @@ def admin_create_categoria():
     conn = get_db()
     cur = conn.cursor()
     cur.execute(
-        "INSERT INTO categorias(nombre, texto_adicional, orden, active) VALUES (?,?,?,?,1)",
+        "INSERT INTO categorias(nombre, texto_adicional, orden, active) VALUES (?,?,?,1)",
         (nombre, texto_adicional, orden)
     )
+    invalidar_referencia(cur)
     conn.commit()
     conn.close()
 
@@ -390,6 +1456,7 @@ def admin_edit_categoria(cat_id):
         "UPDATE categorias SET nombre=?, texto_adicional=?, orden=? WHERE id=?",
         (nombre, texto_adicional, orden, cat_id)
     )
+    invalidar_referencia(cur)
     conn.commit()
     conn.close()
 
@@ -404,10 +1471,11 @@ def admin_delete_categoria(cat_id):
     cur = conn.cursor()
 
     cur.execute("SELECT COUNT(*) as c FROM intenciones WHERE categoria_id=?", (cat_id,))
-    if cur.fetchone()["c"] > 0:
+    if cur.fetchone()["c"] > 0 or en_uso_en_archivo("categoria_id", cat_id):
         flash("❌ No se puede eliminar: categoría en uso.")
     else:
         cur.execute("DELETE FROM categorias WHERE id=?", (cat_id,))
+        invalidar_referencia(cur)
         conn.commit()
 
     conn.close()
@@ -437,6 +1505,7 @@ def admin_create_int_base():
 
     # Si no existe, la inserta normalmente
     cur.execute("INSERT INTO intencion_base(frase, active) VALUES (?, 1)", (frase,))
+    invalidar_referencia(cur)
     conn.commit()
     conn.close()
 
@@ -449,10 +1518,11 @@ def admin_delete_int_base(id):
     conn = get_db(); cur = conn.cursor()
 
     cur.execute("SELECT COUNT(*) as c FROM intenciones WHERE intencion_base_id=?", (id,))
-    if cur.fetchone()["c"] > 0:
+    if cur.fetchone()["c"] > 0 or en_uso_en_archivo("intencion_base_id", id):
         flash("❌ No se puede eliminar: frase en uso.")
     else:
         cur.execute("DELETE FROM intencion_base WHERE id=?", (id,))
+        invalidar_referencia(cur)
         conn.commit()
 
     conn.close()
@@ -468,120 +1538,1044 @@ def admin_delete_int_base(id):
 def admin_settings_pdf_text():
     txt = request.form.get("pdf_texto_global", "")
     conn = get_db(); cur = conn.cursor()
-    cur.execute("INSERT OR REPLACE INTO settings(key,value) VALUES ('pdf_texto_global',?)", (txt,))
+    guardar_setting(cur, "pdf_texto_global", txt)
     conn.commit()
     conn.close()
     return redirect("/admin")
 
 
+# ============================================================
+#  TRABAJOS EN SEGUNDO PLANO
+# ============================================================
+# Las tareas pesadas (PDF no cacheado, exportación del admin, purga) se
+# guardan en la tabla `trabajos` y las ejecutan hilos de cada worker. Como la
+# cola está en SQLite, sobrevive a reinicios: un trabajo "en_curso" cuyo
+# latido se detiene (el proceso murió) vuelve a "pendiente" y lo toma otro
+# worker. TRABAJOS_MAX limita cuántos corren a la vez entre todos los workers.
+
+TRABAJOS_DIR = os.environ.get("TRABAJOS_DIR", os.path.join(APP_DIR, "archivos", "trabajos"))
+TRABAJOS_MAX = int(os.environ.get("TRABAJOS_MAX", "2"))
+TRABAJOS_ESPERA_SEGUNDOS = 2        # cada cuánto buscan trabajo los hilos
+TRABAJOS_LATIDO_SEGUNDOS = 10       # cada cuánto se marca un trabajo como vivo
+TRABAJOS_ABANDONADO_SEGUNDOS = 120  # sin latido por este tiempo: se reintenta
+TRABAJOS_MAX_INTENTOS = 3
+TRABAJOS_RETENCION_DIAS = 7
+
+TIPOS_TRABAJO = {}
+
+_trabajos_evento = threading.Event()
+_trabajos_en_curso = set()
+_trabajos_lock = threading.Lock()
+_trabajadores = {"pid": None}
+
+
+def tipo_trabajo(nombre, titulo, al_fallar=None):
+    """Registra `fn(trabajo_id, params, progreso)` como tipo de trabajo.
+
+    La función devuelve (ruta del archivo resultante o None, mensaje o None).
+    `al_fallar(params)` se llama cuando el trabajo queda en error definitivo.
+    """
+    def registrar(fn):
+        TIPOS_TRABAJO[nombre] = {"fn": fn, "titulo": titulo, "al_fallar": al_fallar}
+        return fn
+    return registrar
+
+
+def _trabajo_fallido(tipo, parametros):
+    al_fallar = TIPOS_TRABAJO.get(tipo, {}).get("al_fallar")
+    if al_fallar:
+        try:
+            al_fallar(json.loads(parametros))
+        except Exception:
+            app.logger.exception("Limpieza del trabajo %s fallida", tipo)
+
+
+def _ahora():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def ruta_trabajo(trabajo_id, nombre):
+    os.makedirs(TRABAJOS_DIR, exist_ok=True)
+    return os.path.join(TRABAJOS_DIR, f"{trabajo_id}_{nombre}")
+
+
+def encolar_trabajo(tipo, params):
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO trabajos(tipo, parametros, usuario_id, creado)
+        VALUES (?,?,?,?)
+    """, (tipo, json.dumps(params), session.get("user_id"), _ahora()))
+    trabajo_id = cur.lastrowid
+    conn.commit()
+    cur.close()
+
+    iniciar_trabajadores()
+    _trabajos_evento.set()
+    return trabajo_id
+
+
+def encolar_y_responder(tipo, params):
+    trabajo_id = encolar_trabajo(tipo, params)
+    if request.args.get("formato") == "json":
+        return jsonify({"id": trabajo_id,
+                        "estado_url": url_for("ver_trabajo", trabajo_id=trabajo_id)}), 202
+    return redirect(url_for("ver_trabajo", trabajo_id=trabajo_id))
+
+
+def _tomar_trabajo(conn):
+    # BEGIN IMMEDIATE: dos hilos (o workers) no pueden tomar el mismo trabajo
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        fila = None
+        en_curso = conn.execute("SELECT COUNT(*) FROM trabajos WHERE estado='en_curso'").fetchone()[0]
+        if en_curso < TRABAJOS_MAX:
+            fila = conn.execute(
+                "SELECT * FROM trabajos WHERE estado='pendiente' ORDER BY id LIMIT 1"
+            ).fetchone()
+        if fila:
+            ahora = _ahora()
+            conn.execute("""
+                UPDATE trabajos SET estado='en_curso', intentos=intentos+1, iniciado=?, latido=?
+                WHERE id=?
+            """, (ahora, ahora, fila["id"]))
+        conn.commit()
+        return fila
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _ejecutar_trabajo(fila):
+    conn = get_db()
+    trabajo_id = fila["id"]
+    ultimo = [0.0]
+
+    def progreso(hechas, total=None):
+        # Como mucho una escritura por segundo
+        if hechas != total and time.monotonic() - ultimo[0] < 1:
+            return
+        ultimo[0] = time.monotonic()
+        conn.execute("UPDATE trabajos SET hechas=?, total=? WHERE id=?", (hechas, total, trabajo_id))
+        conn.commit()
+
+    try:
+        tipo = TIPOS_TRABAJO[fila["tipo"]]
+        archivo, mensaje = tipo["fn"](trabajo_id, json.loads(fila["parametros"]), progreso)
+    except Exception as e:
+        app.logger.exception("Trabajo %s (%s) falló", trabajo_id, fila["tipo"])
+        conn.rollback()
+        conn.execute("UPDATE trabajos SET estado='error', mensaje=?, terminado=? WHERE id=?",
+                     (str(e) or e.__class__.__name__, _ahora(), trabajo_id))
+        _trabajo_fallido(fila["tipo"], fila["parametros"])
+    else:
+        conn.execute("""
+            UPDATE trabajos SET estado='terminado', archivo=?, mensaje=?, terminado=?
+            WHERE id=?
+        """, (archivo, mensaje, _ahora(), trabajo_id))
+    conn.commit()
+
+
+def _hilo_trabajador():
+    while True:
+        _trabajos_evento.wait(TRABAJOS_ESPERA_SEGUNDOS)
+        _trabajos_evento.clear()
+        try:
+            while True:
+                # Un contexto por trabajo: lo guardado en g (referencia() con
+                # los settings) no pasa de un trabajo al siguiente
+                with app.app_context():
+                    fila = _tomar_trabajo(get_db())
+                    if fila is None:
+                        break
+                    with _trabajos_lock:
+                        _trabajos_en_curso.add(fila["id"])
+                    try:
+                        _ejecutar_trabajo(fila)
+                    finally:
+                        with _trabajos_lock:
+                            _trabajos_en_curso.discard(fila["id"])
+        except Exception:
+            app.logger.exception("Error en el hilo de trabajos")
+
+
+def _hilo_vigilante():
+    while True:
+        try:
+            with app.app_context():
+                conn = get_db()
+                ahora = datetime.now()
+
+                # Latido de los trabajos que corren en este proceso
+                with _trabajos_lock:
+                    propios = list(_trabajos_en_curso)
+                if propios:
+                    conn.execute(f"UPDATE trabajos SET latido=? WHERE id IN ({','.join('?' * len(propios))})",
+                                 [_ahora()] + propios)
+
+                # Trabajos cuyo proceso murió: reintentar, o fallar tras varios intentos
+                limite = (ahora - timedelta(seconds=TRABAJOS_ABANDONADO_SEGUNDOS)).isoformat(timespec="seconds")
+                fallidos = conn.execute("""
+                    UPDATE trabajos SET estado='error', mensaje='Interrumpido demasiadas veces', terminado=?
+                    WHERE estado='en_curso' AND latido < ? AND intentos >= ?
+                    RETURNING tipo, parametros
+                """, (_ahora(), limite, TRABAJOS_MAX_INTENTOS)).fetchall()
+                for r in fallidos:
+                    _trabajo_fallido(r["tipo"], r["parametros"])
+                if conn.execute("""
+                    UPDATE trabajos SET estado='pendiente'
+                    WHERE estado='en_curso' AND latido < ?
+                """, (limite,)).rowcount:
+                    _trabajos_evento.set()
+
+                # Misas de los horarios recurrentes, una vez al día
+                generar_misas_del_dia(conn)
+
+                # Métricas de workers reciclados: a retirados.json
+                jubilar_metricas()
+
+                # Limpiar trabajos viejos y sus archivos (las copias de purga se conservan)
+                viejo = (ahora - timedelta(days=TRABAJOS_RETENCION_DIAS)).isoformat(timespec="seconds")
+                filas = conn.execute("""
+                    SELECT id, archivo FROM trabajos
+                    WHERE estado IN ('terminado','error') AND terminado < ?
+                """, (viejo,)).fetchall()
+                for r in filas:
+                    if r["archivo"] and os.path.dirname(r["archivo"]) == TRABAJOS_DIR:
+                        try:
+                            os.remove(r["archivo"])
+                        except OSError:
+                            pass
+                    conn.execute("DELETE FROM trabajos WHERE id=?", (r["id"],))
+                conn.commit()
+        except Exception:
+            app.logger.exception("Error en el vigilante de trabajos")
+        time.sleep(TRABAJOS_LATIDO_SEGUNDOS)
+
+
+def iniciar_trabajadores():
+    # Una vez por proceso (tras un fork de gunicorn el pid cambia)
+    if _trabajadores["pid"] == os.getpid():
+        return
+    with _trabajos_lock:
+        if _trabajadores["pid"] == os.getpid():
+            return
+        _trabajadores["pid"] = os.getpid()
+        _trabajos_en_curso.clear()
+        for n in range(TRABAJOS_MAX):
+            threading.Thread(target=_hilo_trabajador, name=f"trabajos-{n}", daemon=True).start()
+        threading.Thread(target=_hilo_vigilante, name="trabajos-vigilante", daemon=True).start()
+
+
+@app.before_request
+def asegurar_trabajadores():
+    # Retoma los trabajos pendientes después de un reinicio
+    iniciar_trabajadores()
+
+
+def _trabajo_visible(trabajo_id):
+    cur = get_db().cursor()
+    cur.execute("SELECT * FROM trabajos WHERE id=?", (trabajo_id,))
+    t = cur.fetchone()
+    cur.close()
+    if t is None:
+        return None
+    if session.get("role") != "admin" and t["usuario_id"] != session.get("user_id"):
+        return None
+    return t
+
+
+@app.route("/trabajos/<int:trabajo_id>")
+@login_required()
+def ver_trabajo(trabajo_id):
+    t = _trabajo_visible(trabajo_id)
+    if t is None:
+        return "Trabajo no encontrado", 404
+
+    descarga = None
+    if t["estado"] == "terminado" and t["archivo"]:
+        descarga = url_for("descargar_trabajo", trabajo_id=trabajo_id)
+
+    if request.args.get("formato") == "json":
+        return jsonify({
+            "id": t["id"], "tipo": t["tipo"], "estado": t["estado"],
+            "hechas": t["hechas"], "total": t["total"], "mensaje": t["mensaje"],
+            "creado": t["creado"], "terminado": t["terminado"], "descarga": descarga,
+        })
+
+    titulo = TIPOS_TRABAJO.get(t["tipo"], {}).get("titulo", t["tipo"])
+    return render_template("trabajo.html", t=t, titulo=titulo, descarga=descarga)
+
+
+@app.route("/trabajos/<int:trabajo_id>/descargar")
+@login_required()
+def descargar_trabajo(trabajo_id):
+    t = _trabajo_visible(trabajo_id)
+    if t is None or t["estado"] != "terminado" or not t["archivo"]:
+        return "Trabajo no encontrado", 404
+    if not os.path.exists(t["archivo"]):
+        flash("❌ El archivo ya no está disponible.")
+        return redirect(url_for("ver_trabajo", trabajo_id=trabajo_id))
+
+    nombre = os.path.basename(t["archivo"])
+    if os.path.dirname(t["archivo"]) == TRABAJOS_DIR:
+        nombre = nombre.split("_", 1)[1]   # quitar el prefijo "<id>_"
+    if not nombre.endswith(".csv.gz") or os.path.dirname(t["archivo"]) != TRABAJOS_DIR:
+        # (las copias de la purga se descargan tal cual, como .csv.gz)
+        return send_file(t["archivo"], as_attachment=True, download_name=nombre)
+
+    # CSV guardado comprimido: con Content-Encoding gzip si el navegador lo
+    # acepta (sin volver a comprimir); si no, descomprimido al vuelo
+    nombre = nombre[:-3]
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        resp = send_file(t["archivo"], mimetype="text/csv", as_attachment=True, download_name=nombre)
+        resp.headers["Content-Encoding"] = "gzip"
+        resp.vary.add("Accept-Encoding")
+        return resp
+
+    def descomprimido():
+        with gzip.open(t["archivo"], "rb") as f:
+            yield from iter(lambda: f.read(1 << 16), b"")
+
+    return Response(descomprimido(), mimetype="text/csv", headers={
+        "Content-Disposition": f"attachment; filename={nombre}",
+        "Vary": "Accept-Encoding",
+    })
+
+
+# ============================================================
+#  EXPORTAR CSV (respuesta en streaming)
+# ============================================================
+# Las filas se leen del cursor por bloques y se envían a medida que se
+# escriben: la memoria no depende del rango de fechas y el primer byte sale
+# de inmediato. Si el navegador acepta gzip, se comprime al vuelo.
+
+CSV_CHUNK_ROWS = 500
+
+
+def respuesta_csv(cur, encabezados, fila, nombre, al_terminar=None):
+    def filas_csv():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        try:
+            writer.writerow(encabezados)
+            while True:
+                rows = cur.fetchmany(CSV_CHUNK_ROWS)
+                for r in rows:
+                    writer.writerow(fila(r))
+                yield buf.getvalue().encode("utf-8")
+                buf.seek(0)
+                buf.truncate(0)
+                if not rows:
+                    break
+        finally:
+            cur.close()
+            if al_terminar:
+                al_terminar()
+
+    def gzip_csv(partes):
+        z = zlib.compressobj(wbits=31)   # 31 = formato gzip
+        for parte in partes:
+            comprimido = z.compress(parte)
+            if comprimido:
+                yield comprimido
+        yield z.flush()
+
+    headers = {
+        "Content-Disposition": f"attachment; filename={nombre}",
+        "Vary": "Accept-Encoding",
+    }
+    cuerpo = filas_csv()
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        cuerpo = gzip_csv(cuerpo)
+
+    return Response(stream_with_context(cuerpo), mimetype="text/csv", headers=headers)
+
+
 # ============================================================
 #  EXPORTAR CSV (ADMIN)
 # ============================================================
 
+@tipo_trabajo("exportar_admin", "Exportación CSV")
+def trabajo_exportar_admin(trabajo_id, params, progreso):
+    desde = params["desde"]
+    hasta = params["hasta"]
+
+    conn = get_db()
+    # Comprimido en disco; descargar_trabajo lo envía tal cual a quien acepta gzip
+    ruta = ruta_trabajo(trabajo_id, "intenciones_admin.csv.gz")
+    hechas = 0
+    total = 0
+
+    def exportar(esquema, writer):
+        nonlocal hechas, total
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT COUNT(*) FROM {esquema}.intenciones
+            WHERE misa_id IN (SELECT id FROM {esquema}.misas WHERE fecha >= ? AND fecha <= ?)
+        """, (desde, hasta))
+        total += cur.fetchone()[0]
+
+        cur.execute(f"""
+            SELECT i.*, 
+                   c.nombre AS categoria, 
+                   b.frase AS int_base,
+                   u.username AS funcionario, 
+                   m.hora AS misa_hora, 
+                   m.ampm AS misa_ampm,
+                   m.fecha AS misa_fecha
+            FROM {esquema}.intenciones i
+            LEFT JOIN categorias c ON c.id = i.categoria_id
+            LEFT JOIN intencion_base b ON b.id = i.intencion_base_id
+            LEFT JOIN users u ON u.id = i.funcionario_id
+            LEFT JOIN {esquema}.misas m ON m.id = i.misa_id
+            WHERE m.fecha >= ? 
+              AND m.fecha <= ?
+            ORDER BY m.fecha, m.minutos
+        """, (desde, hasta))
+
+        # filas
+        while True:
+            rows = cur.fetchmany(CSV_CHUNK_ROWS)
+            if not rows:
+                break
+            writer.writerows([
+                r["misa_fecha"], 
+                r["misa_hora"], 
+                r["misa_ampm"],
+                r["categoria"], 
+                r["ofrece"],
+                r["int_base"], 
+                r["peticiones"], 
+                r["funcionario"],
+                r["fecha_creado"], 
+                r["fecha_actualizado"]
+            ] for r in rows)
+            hechas += len(rows)
+            progreso(hechas, total)
+        cur.close()
+
+    with gzip.open(ruta, "wt", compresslevel=6, encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+
+        # encabezados
+        writer.writerow([
+            "Fecha Misa", "Hora", "AM/PM", "Categoría", "Ofrece",
+            "Frase Base", "Peticiones", "Funcionario",
+            "Fecha Creado", "Fecha Actualizado"
+        ])
+
+        # Años archivados que pide el rango (uno a la vez), luego la base actual
+        for anio in anios_para_rango(desde, hasta):
+            with con_archivo(conn, [anio]) as (esquema,):
+                exportar(esquema, writer)
+        exportar("main", writer)
+
+    progreso(hechas, hechas)
+    return ruta, f"{hechas} intenciones exportadas"
+
+
 @app.route("/admin/export_csv", methods=["POST"])
 @login_required(role="admin")
 def admin_export_csv():
     desde = request.form["desde"]
     hasta = request.form["hasta"]
+    return encolar_y_responder("exportar_admin", {"desde": desde, "hasta": hasta})
 
-    conn = get_db()
-    cur = conn.cursor()
-
-    cur.execute("""
-        SELECT i.*, 
-               c.nombre AS categoria, 
-               b.frase AS int_base,
-               u.username AS funcionario, 
-               m.hora AS misa_hora, 
-               m.fecha AS misa_fecha
-        FROM intenciones i
-        LEFT JOIN categorias c ON c.id = i.categoria_id
-        LEFT JOIN intencion_base b ON b.id = i.intencion_base_id
-        LEFT JOIN users u ON u.id = i.funcionario_id
-        LEFT JOIN misas m ON m.id = i.misa_id
-        WHERE m.fecha >= ? 
-          AND m.fecha <= ?
-        ORDER BY m.fecha, m.hora
-    """, (desde, hasta))
-
-    rows = cur.fetchall()
-    conn.close()
+# ============================================================
+#  IMPORTAR CSV (admin)
+# ============================================================
+# Para parroquias que pasan del papel o de hojas de cálculo: un CSV con las
+# mismas columnas que la exportación del admin ("AM/PM" es opcional). Se lee
+# fila por fila sin cargar el archivo en memoria; misa, categoría, frase y
+# funcionario se resuelven con diccionarios en memoria y se inserta por lotes,
+# cada lote en su transacción. Las filas con problemas no se insertan y
+# quedan en un CSV de errores para corregir y volver a importar.
+#
+# El lote y el avance (trabajos.hechas) se guardan juntos: si el proceso
+# muere, el reintento continúa después de la última fila confirmada.
+
+IMPORTAR_LOTE = 2000
+COLUMNAS_IMPORTAR = {
+    "FECHA MISA": "fecha", "HORA": "hora", "AM/PM": "ampm", "CATEGORIA": "categoria",
+    "OFRECE": "ofrece", "FRASE BASE": "frase", "PETICIONES": "peticiones",
+    "FUNCIONARIO": "funcionario", "FECHA CREADO": "creado", "FECHA ACTUALIZADO": "actualizado",
+}
+COLUMNAS_OBLIGATORIAS = ("Fecha Misa", "Hora", "Categoría", "Ofrece")
+
+
+def _fecha_importada(texto):
+    texto = texto.strip()
+    for formato in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(texto, formato).date().isoformat()
+        except ValueError:
+            pass
+    return None
+
+
+def _hora_importada(texto, ampm):
+    """("HH:MM", "AM"/"PM"/None) desde "6:00", "06:00 PM", "6:00 p. m.", "18:00"."""
+    m = re.fullmatch(r"(\d{1,2}):(\d{2})(?::\d{2})?\s*([AP])?\.?\s*(?:M\.?)?",
+                     texto.strip().upper())
+    if not m:
+        return None, None
+    hora = f"{int(m.group(1)):02d}:{m.group(2)}"
+    ampm = (m.group(3) or ampm.strip().upper()[:1] or "")
+    return hora, (ampm + "M" if ampm in ("A", "P") else None)
+
+
+def _abrir_csv_importado(ruta):
+    """(archivo de texto, dialecto, filas aproximadas); acepta UTF-8 o el ANSI de Excel."""
+    decodificador = codecs.getincrementaldecoder("utf-8")()
+    codificacion, lineas = "utf-8-sig", 0
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 16), b""):
+            lineas += bloque.count(b"\n")
+            if codificacion == "utf-8-sig":
+                try:
+                    decodificador.decode(bloque)
+                except UnicodeDecodeError:
+                    codificacion = "cp1252"
+
+    archivo = open(ruta, encoding=codificacion, newline="")
+    muestra = archivo.read(4096)
+    archivo.seek(0)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+    except csv.Error:
+        dialecto = csv.excel
+    return archivo, dialecto, max(lineas - 1, 0)
+
+
+class ResolverImportacion:
+    """Diccionarios nombre -> id para las filas importadas."""
+
+    def __init__(self, cur, usuario_id):
+        self.cur = cur
+        self.usuario_id = usuario_id
+        ref = referencia()
+        self.categorias = {normalizar_nombre(c["nombre"]): c["id"] for c in ref["categorias"]}
+        self.frases = {normalizar_nombre(b["frase"]): b["id"] for b in ref["frases"]}
+        # DIFUNTOS y SALUD: por id (como el registro) o por nombre (como la edición y el PDF)
+        self.sin_frase = {ID_DIFUNTOS, ID_SALUD} | {
+            c["id"] for c in ref["categorias"]
+            if "DIFUN" in c["nombre"].upper() or "SALUD" in c["nombre"].upper()}
+        cur.execute("SELECT id, username FROM users")
+        self.usuarios = {normalizar_nombre(u["username"]): u["id"] for u in cur.fetchall()}
+        self._misas = {}
+
+    def misa(self, fecha, hora, ampm):
+        # Misas de cada fecha, cargadas la primera vez que aparece esa fecha
+        if fecha not in self._misas:
+            self.cur.execute("SELECT id, hora, ampm, minutos FROM misas WHERE fecha=?", (fecha,))
+            self._misas[fecha] = self.cur.fetchall()
+        hh = int(hora[:2])
+        if ampm or hh >= 13 or hh == 0:
+            # Con AM/PM, o una hora que solo puede ser de 24 h ("18:00", "00:30"):
+            # se compara por minutos, la hora se guarda como se escribió ("06:00" PM)
+            minutos = minutos_misa(hora, ampm)
+            candidatas = [m for m in self._misas[fecha] if m["minutos"] == minutos]
+        else:
+            candidatas = [m for m in self._misas[fecha] if m["hora"] == hora]
+        if len(candidatas) > 1:
+            raise ValueError(f"hay varias misas a las {hora} del {fecha}; indique AM/PM")
+        if not candidatas:
+            raise ValueError(f"no existe misa el {fecha} a las {hora} {ampm or ''}".strip())
+        return candidatas[0]["id"]
+
+    def fila(self, datos, ahora):
+        """Tupla para INSERTAR_INTENCION, o ValueError con el motivo."""
+        fecha = _fecha_importada(datos.get("fecha", ""))
+        if not fecha:
+            raise ValueError("fecha de misa inválida (use AAAA-MM-DD o DD/MM/AAAA)")
+        hora, ampm = _hora_importada(datos.get("hora", ""), datos.get("ampm", ""))
+        if not hora:
+            raise ValueError("hora inválida (use HH:MM)")
+        misa_id = self.misa(fecha, hora, ampm)
+
+        categoria_id = self.categorias.get(normalizar_nombre(datos.get("categoria", "")))
+        if categoria_id is None:
+            raise ValueError(f"categoría desconocida: {datos.get('categoria', '')}")
+
+        # Como lo guarda la aplicación (y lo exporta): el nombre puede estar en
+        # "Ofrece" o en "Peticiones" (DIFUNTOS y SALUD, los datos de ejemplo)
+        ofrece = datos.get("ofrece", "").strip()[:200]
+        peticiones = datos.get("peticiones", "").strip()[:250]
+        if not ofrece and not peticiones:
+            raise ValueError("falta el nombre (\"Ofrece\" o \"Peticiones\")")
 
-    output = io.StringIO()
-    writer = csv.writer(output)
+        int_base_id = None
+        frase = normalizar_nombre(datos.get("frase", ""))
+        if frase and categoria_id not in self.sin_frase:
+            int_base_id = self.frases.get(frase)
+            if int_base_id is None:
+                raise ValueError(f"frase base desconocida: {datos.get('frase', '')}")
+
+        # Funcionario vacío o que no existe en esta parroquia: quien importa
+        funcionario_id = self.usuarios.get(normalizar_nombre(datos.get("funcionario", "")),
+                                           self.usuario_id)
+        creado = datos.get("creado", "").strip() or ahora
+        actualizado = datos.get("actualizado", "").strip() or creado
+        return (misa_id, categoria_id, ofrece, int_base_id, peticiones,
+                creado, actualizado, funcionario_id)
+
+
+def _borrar_subida(params):
+    # El CSV subido solo se borra al terminar; si el trabajo falla, aquí
+    try:
+        os.remove(params["archivo"])
+    except FileNotFoundError:
+        pass
 
-    # encabezados
-    writer.writerow([
-        "Fecha Misa", "Hora", "Categoría", "Ofrece",
-        "Frase Base", "Peticiones", "Funcionario",
-        "Fecha Creado", "Fecha Actualizado"
-    ])
 
-    # filas
-    for r in rows:
-        writer.writerow([
-            r["misa_fecha"], 
-            r["misa_hora"], 
-            r["categoria"], 
-            r["ofrece"],
-            r["int_base"], 
-            r["peticiones"], 
-            r["funcionario"],
-            r["fecha_creado"], 
-            r["fecha_actualizado"]
-        ])
+@tipo_trabajo("importar_admin", "Importación CSV", al_fallar=_borrar_subida)
+def trabajo_importar_admin(trabajo_id, params, progreso):
+    conn = get_db()
+    cur = conn.cursor()
 
-    output.seek(0)
+    # Reintento tras una caída: saltar las filas ya confirmadas
+    cur.execute("SELECT hechas FROM trabajos WHERE id=?", (trabajo_id,))
+    confirmadas = cur.fetchone()["hechas"] or 0
+
+    archivo, dialecto, total = _abrir_csv_importado(params["archivo"])
+    lector = csv.reader(archivo, dialecto)
+    encabezado = next(lector, [])
+    columnas = [COLUMNAS_IMPORTAR.get(normalizar_nombre(c)) for c in encabezado]
+    faltan = [c for c in COLUMNAS_OBLIGATORIAS
+              if COLUMNAS_IMPORTAR[normalizar_nombre(c)] not in columnas]
+    if faltan:
+        archivo.close()
+        raise ValueError("Faltan columnas en el CSV: " + ", ".join(faltan))
+
+    resolver = ResolverImportacion(cur, params["usuario_id"])
+    ruta_errores = ruta_trabajo(trabajo_id, "errores_importacion.csv")
+    insertadas = errores = leidas = 0
+    with archivo, open(ruta_errores, "a" if confirmadas else "w",
+                       encoding="utf-8", newline="") as f_errores:
+        reporte = csv.writer(f_errores)
+        if not confirmadas:
+            reporte.writerow(["Fila", "Error"] + encabezado)
+
+        lote, malas = [], []
+        ahora = datetime.now().isoformat()
+
+        def guardar_lote():
+            if lote:
+                cur.executemany(INSERTAR_INTENCION, lote)
+                sumar_nombres(cur, "ofrece", [r[2] for r in lote])
+                sumar_nombres(cur, "peticiones", [r[4] for r in lote])
+            cur.execute("UPDATE trabajos SET hechas=?, total=? WHERE id=?",
+                        (leidas, max(total, leidas), trabajo_id))
+            conn.commit()
+            reporte.writerows(malas)
+            lote.clear()
+            malas.clear()
+
+        for valores in lector:
+            leidas += 1
+            if leidas <= confirmadas or not any(v.strip() for v in valores):
+                continue
+            datos = {c: v for c, v in zip(columnas, valores) if c}
+            try:
+                lote.append(resolver.fila(datos, ahora))
+            except ValueError as e:
+                # +1 por el encabezado: el número de fila que ve quien abre el CSV
+                malas.append([leidas + 1, str(e)] + valores)
+            if len(lote) + len(malas) >= IMPORTAR_LOTE:
+                insertadas += len(lote)
+                errores += len(malas)
+                guardar_lote()
+
+        insertadas += len(lote)
+        errores += len(malas)
+        guardar_lote()
+    cur.close()
+
+    os.remove(params["archivo"])
+    progreso(leidas, leidas)
+    mensaje = f"{insertadas} intenciones importadas, {errores} filas con errores"
+    if confirmadas:
+        mensaje += f" (continuó desde la fila {confirmadas + 2})"
+    if errores:
+        return ruta_errores, mensaje
+    os.remove(ruta_errores)
+    return None, mensaje
+
+
+@app.route("/admin/import_csv", methods=["POST"])
+@login_required(role="admin")
+def admin_import_csv():
+    subido = request.files.get("archivo")
+    if not subido or not subido.filename:
+        flash("Debe seleccionar un archivo CSV.")
+        return redirect("/admin?section=import")
 
-    return send_file(
-        io.BytesIO(output.getvalue().encode("utf-8")),
-        mimetype="text/csv",
-        as_attachment=True,
-        download_name="intenciones_admin.csv"
-    )
+    # El archivo queda en disco hasta que el trabajo termina de leerlo
+    ruta = ruta_trabajo("subida", secrets.token_hex(8) + ".csv")
+    subido.save(ruta)
+    return encolar_y_responder("importar_admin", {"archivo": ruta, "usuario_id": session["user_id"]})
 
 
 # ============================================================
 #  BORRAR INTENCIONES POR RANGO
 # ============================================================
+# Se borra por lotes de PURGA_LOTE filas, confirmando entre lotes para que
+# los funcionarios puedan seguir registrando mientras tanto. Opcionalmente
+# cada lote se copia antes a un CSV comprimido en PURGA_DIR.
+
+PURGA_LOTE = 500
+PURGA_DIR = os.environ.get("PURGA_DIR", os.path.join(APP_DIR, "archivos"))
+
+COLUMNAS_PURGA = [
+    "id", "misa_id", "misa_fecha", "misa_hora", "misa_ampm",
+    "categoria_id", "categoria", "ofrece", "intencion_base_id", "int_base",
+    "peticiones", "fecha_creado", "fecha_actualizado",
+    "funcionario_id", "funcionario",
+]
+
+
+def purgar_intenciones(desde, hasta, archivo=None, progreso=None):
+    """Borra las intenciones de misas entre `desde` y `hasta` (inclusive).
+
+    Si se indica `archivo`, las filas se escriben antes en ese CSV gzip.
+    `progreso(hechas, total)` se llama después de cada lote.
+    Devuelve el número de intenciones borradas.
+    """
+    conn = get_db()
+    cur = conn.cursor()
+
+    # fecha se guarda como 'YYYY-MM-DD': comparar el texto usa idx_misas_fecha_minutos
+    rango = "SELECT id FROM misas WHERE fecha >= ? AND fecha <= ?"
+
+    cur.execute(f"SELECT COUNT(*) FROM intenciones WHERE misa_id IN ({rango})", (desde, hasta))
+    total = cur.fetchone()[0]
+
+    salida = writer = None
+    if archivo:
+        os.makedirs(os.path.dirname(archivo), exist_ok=True)
+        # Si un intento anterior se interrumpió, seguir el mismo archivo
+        # (gzip admite varios miembros concatenados)
+        continuar = os.path.exists(archivo)
+        salida = gzip.open(archivo, "at" if continuar else "wt", encoding="utf-8", newline="")
+        writer = csv.writer(salida)
+        if not continuar:
+            writer.writerow(COLUMNAS_PURGA)
+
+    def borrar_lote(filas):
+        if writer:
+            writer.writerows([[r[col] for col in COLUMNAS_PURGA] for r in filas])
+            salida.flush()
+
+        ids = [r["id"] for r in filas]
+        cur.execute(f"DELETE FROM intenciones WHERE id IN ({','.join('?' * len(ids))})", ids)
+        conn.commit()
+
+    # Se recorre misa por misa (pocas filas cada una, por idx_intenciones_misa)
+    # juntando filas hasta completar cada lote.
+    cur.execute(rango + " ORDER BY fecha, id", (desde, hasta))
+    misa_ids = [r["id"] for r in cur.fetchall()]
+
+    hechas = 0
+    lote = []
+    try:
+        for misa_id in misa_ids:
+            cur.execute("""
+                SELECT i.*, m.fecha AS misa_fecha, m.hora AS misa_hora, m.ampm AS misa_ampm,
+                       c.nombre AS categoria, b.frase AS int_base, u.username AS funcionario
+                FROM intenciones i
+                JOIN misas m ON m.id=i.misa_id
+                LEFT JOIN categorias c ON c.id=i.categoria_id
+                LEFT JOIN intencion_base b ON b.id=i.intencion_base_id
+                LEFT JOIN users u ON u.id=i.funcionario_id
+                WHERE i.misa_id=?
+                ORDER BY i.id
+            """, (misa_id,))
+            lote.extend(cur.fetchall())
+
+            while len(lote) >= PURGA_LOTE:
+                borrar_lote(lote[:PURGA_LOTE])
+                del lote[:PURGA_LOTE]
+                hechas += PURGA_LOTE
+                if progreso:
+                    progreso(hechas, total)
+
+        if lote:
+            borrar_lote(lote)
+            hechas += len(lote)
+            if progreso:
+                progreso(hechas, total)
+    finally:
+        if salida:
+            salida.close()
+        cur.close()
+
+    return hechas
+
+
+@tipo_trabajo("purgar", "Eliminación de intenciones")
+def trabajo_purgar(trabajo_id, params, progreso):
+    hasta = params["hasta"]
+
+    # identificar última eliminación
+    desde = referencia()["settings"].get("last_deletion", "0001-01-01")
+
+    archivo = None
+    if params.get("archivar"):
+        archivo = os.path.join(PURGA_DIR, f"purga_{desde}_{hasta}_t{trabajo_id}.csv.gz")
+
+    borradas = purgar_intenciones(desde, hasta, archivo=archivo, progreso=progreso)
+
+    conn = get_db(); cur = conn.cursor()
+    guardar_setting(cur, "last_deletion", hasta)
+    conn.commit()
+    cur.close()
+
+    return archivo, f"Eliminadas {borradas} intenciones hasta {hasta}"
+
 
 @app.route("/admin/delete_range", methods=["POST"])
 @login_required(role="admin")
 def admin_delete_range():
     hasta = request.form["hasta"]
+    try:
+        hasta = date.fromisoformat(hasta).isoformat()
+    except ValueError:
+        flash("❌ Fecha inválida.")
+        return redirect("/admin?section=delete")
 
-    conn = get_db(); cur = conn.cursor()
+    # Dos purgas a la vez se pisarían last_deletion
+    cur = get_db().cursor()
+    cur.execute("SELECT id FROM trabajos WHERE tipo='purgar' AND estado IN ('pendiente','en_curso')")
+    activa = cur.fetchone()
+    cur.close()
+    if activa:
+        flash("⚠️ Ya hay una eliminación en curso.")
+        return redirect(url_for("ver_trabajo", trabajo_id=activa["id"]))
 
-    # identificar última eliminación
-    cur.execute("SELECT value FROM settings WHERE key='last_deletion'")
-    row = cur.fetchone()
-    desde = row["value"] if row else "0001-01-01"
+    return encolar_y_responder("purgar", {"hasta": hasta, "archivar": bool(request.form.get("archivar"))})
 
-    # obtener intenciones del rango
-    cur.execute("""
-        SELECT i.id
-        FROM intenciones i
-        LEFT JOIN misas m ON m.id=i.misa_id
-        WHERE date(m.fecha) BETWEEN date(?) AND date(?)
-    """, (desde, hasta))
 
-    ids = [r["id"] for r in cur.fetchall()]
+@app.route("/admin/purgas/<nombre>")
+@login_required(role="admin")
+def admin_descargar_purga(nombre):
+    return send_from_directory(PURGA_DIR, nombre, as_attachment=True)
 
-    # borrar
-    for i in ids:
-        cur.execute("DELETE FROM intenciones WHERE id=?", (i,))
+# ============================================================
+#  ARCHIVO HISTÓRICO (archive-AAAA.db)
+# ============================================================
+# Hay que conservar los registros, pero no en la base de todos los días. Las
+# misas anteriores a una fecha y sus intenciones se mueven a un archivo SQLite
+# por año (mismas tablas y su propio índice de búsqueda) junto a data.db.
+# settings.archivo_hasta guarda hasta dónde llega el archivo: exportaciones y
+# búsqueda adjuntan (ATTACH) solo los años que su rango necesita, y el uso
+# diario no los toca. Se mueve mes a mes, cada mes en su transacción; con WAL
+# la transacción no es atómica entre dos bases, por eso se copia con
+# INSERT OR IGNORE antes de borrar y repetir el trabajo es seguro.
 
-    cur.execute("INSERT OR REPLACE INTO settings(key,value) VALUES ('last_deletion',?)", (hasta,))
-    conn.commit()
-    conn.close()
+ARCHIVO_DIR = os.environ.get("ARCHIVO_DIR", os.path.dirname(os.path.abspath(DB)))
+ARCHIVO_MESES = int(os.environ.get("ARCHIVO_MESES", "24"))   # antigüedad sugerida
+ARCHIVO_ADJUNTOS_MAX = 9    # SQLite admite 10 bases adjuntas por conexión
 
-    flash(f"Eliminadas intenciones hasta {hasta}")
-    return redirect("/admin")
+COLUMNAS_MISAS_ARCHIVO = "id, fecha, hora, ampm, minutos"
+COLUMNAS_INTENCIONES_ARCHIVO = ("id, misa_id, categoria_id, ofrece, intencion_base_id, "
+                                "peticiones, fecha_creado, fecha_actualizado, funcionario_id")
+
+
+def ruta_archivo(anio):
+    return os.path.join(ARCHIVO_DIR, f"archive-{anio}.db")
+
+
+def inicio_de_mes_hace(meses):
+    """Primer día del mes de hace `meses` meses."""
+    hoy = date.today()
+    n = hoy.year * 12 + hoy.month - 1 - meses
+    return date(n // 12, n % 12 + 1, 1)
+
+
+def archivo_hasta():
+    """Fecha (AAAA-MM-DD) antes de la cual las misas están en el archivo; "" si no hay."""
+    return referencia()["settings"].get("archivo_hasta", "")
+
+
+def anios_archivo():
+    try:
+        nombres = os.listdir(ARCHIVO_DIR)
+    except OSError:
+        return []
+    return sorted(int(m.group(1)) for m in map(re.compile(r"archive-(\d{4})\.db$").match, nombres) if m)
+
+
+def anios_para_rango(desde, hasta):
+    """Años archivados que tocan [desde, hasta]; [] si el rango es solo de datos recientes."""
+    limite = archivo_hasta()
+    if not limite or (desde or "") >= limite:
+        return []
+    ultimo = min(hasta or limite, limite)
+    return [a for a in anios_archivo() if (desde or "")[:4] <= str(a) <= ultimo[:4]]
+
+
+def crear_esquema_archivo(conn, esquema):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {esquema}.misas (
+            id INTEGER PRIMARY KEY, fecha TEXT, hora TEXT, ampm TEXT, minutos INTEGER
+        )""")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {esquema}.intenciones (
+            id INTEGER PRIMARY KEY, misa_id INTEGER, categoria_id INTEGER, ofrece TEXT,
+            intencion_base_id INTEGER, peticiones TEXT, fecha_creado TEXT,
+            fecha_actualizado TEXT, funcionario_id INTEGER
+        )""")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {esquema}.idx_misas_fecha_minutos ON misas(fecha, minutos)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {esquema}.idx_intenciones_misa ON intenciones(misa_id)")
+    conn.execute(f"""
+        CREATE INDEX IF NOT EXISTS {esquema}.idx_intenciones_funcionario_fecha
+        ON intenciones(funcionario_id, fecha_creado)""")
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {esquema}.intenciones_fts USING fts5(
+            ofrece, peticiones,
+            content='intenciones', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )""")
+
+
+@contextmanager
+def con_archivo(conn, anios, crear=False):
+    """Adjunta archive-AAAA.db de cada año; devuelve los esquemas ("archivo_AAAA")."""
+    if len(anios) > ARCHIVO_ADJUNTOS_MAX:
+        raise ValueError(f"El rango abarca más de {ARCHIVO_ADJUNTOS_MAX} años del archivo.")
+    esquemas = []
+    # Una descarga que nunca se leyó pudo dejar el año adjunto a esta conexión
+    adjuntas = {r[1] for r in conn.execute("PRAGMA database_list")}
+    try:
+        for anio in anios:
+            esquema = f"archivo_{int(anio)}"
+            if esquema in adjuntas:
+                conn.execute(f"DETACH DATABASE {esquema}")
+            conn.execute(f"ATTACH DATABASE ? AS {esquema}", (ruta_archivo(int(anio)),))
+            esquemas.append(esquema)
+            if crear:
+                crear_esquema_archivo(conn, esquema)
+                conn.commit()
+        yield esquemas
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        for esquema in esquemas:
+            conn.execute(f"DETACH DATABASE {esquema}")
+
+
+def en_uso_en_archivo(columna, valor):
+    """True si alguna intención archivada (de cualquier año) tiene `columna` = valor."""
+    conn = get_db()
+    for anio in anios_archivo():
+        with con_archivo(conn, [anio]) as (esquema,):
+            if conn.execute(f"SELECT 1 FROM {esquema}.intenciones WHERE {columna}=? LIMIT 1",
+                            (valor,)).fetchone():
+                return True
+    return False
+
+
+def mover_al_archivo(conn, esquema, desde, hasta):
+    """Mueve las misas con desde <= fecha < hasta y sus intenciones; devuelve cuántas intenciones."""
+    rango = "SELECT id FROM main.misas WHERE fecha >= ? AND fecha < ?"
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Índice de búsqueda del archivo: solo lo que aún no se había copiado
+        conn.execute(f"""
+            INSERT INTO {esquema}.intenciones_fts(rowid, ofrece, peticiones)
+            SELECT id, ofrece, peticiones FROM main.intenciones
+            WHERE misa_id IN ({rango}) AND id NOT IN (SELECT id FROM {esquema}.intenciones)
+        """, (desde, hasta))
+        conn.execute(f"""
+            INSERT OR IGNORE INTO {esquema}.misas({COLUMNAS_MISAS_ARCHIVO})
+            SELECT {COLUMNAS_MISAS_ARCHIVO} FROM main.misas WHERE fecha >= ? AND fecha < ?
+        """, (desde, hasta))
+        conn.execute(f"""
+            INSERT OR IGNORE INTO {esquema}.intenciones({COLUMNAS_INTENCIONES_ARCHIVO})
+            SELECT {COLUMNAS_INTENCIONES_ARCHIVO} FROM main.intenciones WHERE misa_id IN ({rango})
+        """, (desde, hasta))
+        movidas = conn.execute(f"DELETE FROM main.intenciones WHERE misa_id IN ({rango})",
+                               (desde, hasta)).rowcount
+        conn.execute("DELETE FROM main.misas WHERE fecha >= ? AND fecha < ?", (desde, hasta))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return movidas
+
+
+@tipo_trabajo("archivar", "Archivo histórico")
+def trabajo_archivar(trabajo_id, params, progreso):
+    hasta = params["hasta"]
+    conn = get_db()
+    cur = conn.cursor()
+
+    # Primero la marca: mientras se mueve, las consultas ya buscan en ambos lados
+    if hasta > archivo_hasta():
+        guardar_setting(cur, "archivo_hasta", hasta)
+        conn.commit()
+
+    cur.execute("SELECT DISTINCT substr(fecha, 1, 7) FROM misas WHERE fecha < ? ORDER BY 1", (hasta,))
+    meses = [r[0] for r in cur.fetchall()]
+    cur.close()
+
+    movidas = 0
+    for n, mes in enumerate(meses, 1):
+        anio, m = int(mes[:4]), int(mes[5:7])
+        siguiente = date(anio + m // 12, m % 12 + 1, 1).isoformat()
+        with con_archivo(conn, [anio], crear=True) as (esquema,):
+            movidas += mover_al_archivo(conn, esquema, mes + "-01", min(siguiente, hasta))
+        progreso(n, len(meses))
+
+    progreso(len(meses), len(meses))
+    anios = sorted({m[:4] for m in meses})
+    return None, (f"{movidas} intenciones anteriores a {hasta} movidas al archivo"
+                  + (f" ({', '.join(anios)})" if anios else ""))
+
+
+@app.cli.command("archivar")
+@click.option("--meses", default=ARCHIVO_MESES, show_default=True,
+              help="archivar las misas con más de estos meses de antigüedad")
+def archivar_comando(meses):
+    """Mueve las misas antiguas y sus intenciones a archive-AAAA.db."""
+    hasta = inicio_de_mes_hace(meses).isoformat()
+    _, mensaje = trabajo_archivar(None, {"hasta": hasta}, lambda *a: None)
+    print(mensaje)
+
+
+@app.route("/admin/archivar", methods=["POST"])
+@login_required(role="admin")
+def admin_archivar():
+    try:
+        hasta = date.fromisoformat(request.form["hasta"])
+    except ValueError:
+        flash("❌ Fecha inválida.")
+        return redirect("/admin?section=archivo")
+    if hasta > date.today():
+        flash("❌ Solo se pueden archivar misas pasadas.")
+        return redirect("/admin?section=archivo")
+
+    cur = get_db().cursor()
+    cur.execute("SELECT id FROM trabajos WHERE tipo='archivar' AND estado IN ('pendiente','en_curso')")
+    activo = cur.fetchone()
+    cur.close()
+    if activo:
+        flash("⚠️ Ya hay un archivado en curso.")
+        return redirect(url_for("ver_trabajo", trabajo_id=activo["id"]))
+
+    return encolar_y_responder("archivar", {"hasta": hasta.isoformat()})
 
 # ============================================================
 #  PANEL FUNCIONARIO
 # ============================================================
 
+PROPIAS_POR_PAGINA = 50
+
+# Alcances del listado "Mis intenciones"
+ALCANCES_PROPIAS = ("proximas", "dia", "todas")
+
 @app.route("/funcionario")
 @login_required()
 def funcionario():
@@ -593,37 +2587,55 @@ def funcionario():
     conn = get_db()
     cur = conn.cursor()
 
-    # Consultar misas ordenadas por hora y AM/PM correctamente
-    cur.execute("""
-        SELECT *
-        FROM misas
-        WHERE fecha=?
-        ORDER BY 
-            CASE ampm WHEN 'AM' THEN 0 ELSE 1 END,
-            substr(hora,1,2) + 0,
-            substr(hora,4,2) + 0
-    """, (dia,))
+    # Consultar misas ordenadas por hora (columna minutos, con índice)
+    cur.execute("SELECT * FROM misas WHERE fecha=? ORDER BY minutos", (dia,))
     misas = cur.fetchall()
 
-    # Categorías activas
-    cur.execute("SELECT * FROM categorias WHERE active=1 ORDER BY orden")
-    categorias = cur.fetchall()
-
-    # Intenciones base activas
-    cur.execute("SELECT * FROM intencion_base WHERE active=1 ORDER BY frase")
-    int_b = cur.fetchall()
-
-    # Intenciones propias del funcionario
-    cur.execute("""
-        SELECT i.*, c.nombre AS categoria, b.frase AS int_base
+    # Categorías e intenciones base activas (caché de referencia)
+    ref = referencia()
+    categorias = ref["categorias_activas"]
+    int_b = ref["frases_activas"]
+
+    # Intenciones propias del funcionario (paginadas por fecha_creado, id)
+    alcance = request.args.get("alcance", "proximas")
+    if alcance not in ALCANCES_PROPIAS:
+        alcance = "proximas"
+
+    filtros = ["i.funcionario_id=?"]
+    params = [session["user_id"]]
+
+    if alcance == "proximas":
+        filtros.append("(m.fecha >= ? OR m.fecha = ?)")
+        params += [date.today().isoformat(), dia]
+    elif alcance == "dia":
+        filtros.append("m.fecha = ?")
+        params.append(dia)
+
+    # Cursor "fecha_creado|id" de la última fila ya mostrada
+    antes_fecha, _, antes_id = request.args.get("antes", "").rpartition("|")
+    if antes_fecha and antes_id.isdigit():
+        filtros.append("(i.fecha_creado < ? OR (i.fecha_creado = ? AND i.id < ?))")
+        params += [antes_fecha, antes_fecha, int(antes_id)]
+
+    cur.execute(f"""
+        SELECT i.*, c.nombre AS categoria, b.frase AS int_base,
+               m.fecha AS misa_fecha, m.hora AS misa_hora, m.ampm AS misa_ampm
         FROM intenciones i
+        LEFT JOIN misas m ON m.id=i.misa_id
         LEFT JOIN categorias c ON c.id=i.categoria_id
         LEFT JOIN intencion_base b ON b.id=i.intencion_base_id
-        WHERE i.funcionario_id=?
-        ORDER BY i.fecha_creado DESC
-    """, (session["user_id"],))
+        WHERE {" AND ".join(filtros)}
+        ORDER BY i.fecha_creado DESC, i.id DESC
+        LIMIT ?
+    """, params + [PROPIAS_POR_PAGINA + 1])
     propias = cur.fetchall()
 
+    siguiente = None
+    if len(propias) > PROPIAS_POR_PAGINA:
+        propias = propias[:PROPIAS_POR_PAGINA]
+        ultima = propias[-1]
+        siguiente = f"{ultima['fecha_creado']}|{ultima['id']}"
+
     conn.close()
 
     return render_template(
@@ -632,46 +2644,192 @@ def funcionario():
         categorias=categorias,
         int_b=int_b,
         propias=propias,
-        dia=dia
+        dia=dia,
+        alcance=alcance,
+        siguiente=siguiente
     )
 
 
+# ============================================================
+#  AUTOCOMPLETAR NOMBRES (ofrece / peticiones)
+# ============================================================
+# Las mismas familias y difuntos vuelven semana tras semana. Cada nombre
+# (lo separado por comas en el campo) se cuenta en nombres_frecuentes al
+# registrar o editar; /funcionario/nombres sugiere los más usados que empiezan
+# por lo escrito. Cada worker guarda en memoria los prefijos más pedidos.
+# Purgar intenciones no descuenta: los nombres siguen siendo útiles.
+
+CAMPOS_NOMBRES = ("ofrece", "peticiones")
+NOMBRES_MAX_LARGO = 100         # trozos más largos son texto libre, no nombres
+NOMBRES_SUGERENCIAS = 10
+NOMBRES_LRU_MAX = 512           # prefijos en memoria por worker
+NOMBRES_LRU_SEGUNDOS = 60       # para ver lo que registran los otros workers
+
+_nombres_lru = OrderedDict()
+_nombres_lock = threading.Lock()
+
+
+def normalizar_nombre(texto):
+    """Mayúsculas, sin tildes ni espacios repetidos: "  niño  José" -> "NINO JOSE"."""
+    sin_tildes = "".join(ch for ch in unicodedata.normalize("NFKD", texto)
+                         if not unicodedata.combining(ch))
+    return " ".join(sin_tildes.upper().split())
+
+
+def partes_nombre(texto):
+    """Nombres de un campo: {clave: como se escribió}."""
+    partes = {}
+    for trozo in (texto or "").split(","):
+        nombre = " ".join(trozo.split())
+        if nombre and len(nombre) <= NOMBRES_MAX_LARGO:
+            partes[normalizar_nombre(nombre)] = nombre
+    return partes
+
+
+def _olvidar_prefijos(campo, claves):
+    with _nombres_lock:
+        for llave in [k for k in _nombres_lru
+                      if k[0] == campo and any(c.startswith(k[1]) for c in claves)]:
+            del _nombres_lru[llave]
+
+
+def sumar_nombres(cur, campo, textos):
+    """Cuenta los nombres de varios textos del campo con un solo executemany."""
+    usos = {}
+    for texto in textos:
+        for clave, nombre in partes_nombre(texto).items():
+            actual = usos.setdefault(clave, [nombre, 0])
+            actual[0] = nombre
+            actual[1] += 1
+    if not usos:
+        return
+    cur.executemany("""
+        INSERT INTO nombres_frecuentes(campo, clave, nombre, usos) VALUES (?,?,?,?)
+        ON CONFLICT(campo, clave) DO UPDATE SET usos = usos + excluded.usos, nombre = excluded.nombre
+    """, [(campo, clave, nombre, n) for clave, (nombre, n) in usos.items()])
+    _olvidar_prefijos(campo, usos)
+
+
+def contar_nombres(cur, campo, antes, despues):
+    """Suma los nombres nuevos del campo y descuenta los que se quitaron."""
+    viejos, nuevos = partes_nombre(antes), partes_nombre(despues)
+    sumar_nombres(cur, campo, [nombre for clave, nombre in nuevos.items() if clave not in viejos])
+
+    quitadas = viejos.keys() - nuevos.keys()
+    for clave in quitadas:
+        cur.execute("UPDATE nombres_frecuentes SET usos = usos - 1 WHERE campo=? AND clave=?",
+                    (campo, clave))
+        cur.execute("DELETE FROM nombres_frecuentes WHERE campo=? AND clave=? AND usos <= 0",
+                    (campo, clave))
+    _olvidar_prefijos(campo, quitadas)
+
+
+def llenar_nombres_frecuentes(conn):
+    # Migración 6: contar lo que ya está en intenciones
+    for campo in CAMPOS_NOMBRES:
+        textos = [texto for (texto,) in conn.execute(f"SELECT {campo} FROM intenciones")]
+        sumar_nombres(conn, campo, textos)
+
+
+def sugerir_nombres(cur, campo, prefijo):
+    llave = (campo, prefijo)
+    ahora = time.monotonic()
+    with _nombres_lock:
+        guardado = _nombres_lru.get(llave)
+        if guardado and ahora - guardado[0] < NOMBRES_LRU_SEGUNDOS:
+            _nombres_lru.move_to_end(llave)
+            return guardado[1]
+
+    # Rango [prefijo, prefijo con la última letra +1) sobre la llave primaria
+    hasta = prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+    cur.execute("""
+        SELECT nombre, usos FROM nombres_frecuentes
+        WHERE campo=? AND clave >= ? AND clave < ?
+        ORDER BY usos DESC, clave
+        LIMIT ?
+    """, (campo, prefijo, hasta, NOMBRES_SUGERENCIAS))
+    sugerencias = [{"nombre": r["nombre"], "usos": r["usos"]} for r in cur.fetchall()]
+
+    with _nombres_lock:
+        _nombres_lru[llave] = (ahora, sugerencias)
+        _nombres_lru.move_to_end(llave)
+        while len(_nombres_lru) > NOMBRES_LRU_MAX:
+            _nombres_lru.popitem(last=False)
+    return sugerencias
+
+
+@app.route("/funcionario/nombres")
+@login_required()
+def funcionario_nombres():
+    campo = request.args.get("campo", "ofrece")
+    if campo not in CAMPOS_NOMBRES:
+        return jsonify({"error": "campo inválido"}), 400
+
+    # Se completa el último nombre de la lista separada por comas
+    prefijo = normalizar_nombre(request.args.get("q", "").rsplit(",", 1)[-1])
+    sugerencias = []
+    if prefijo:
+        cur = get_db().cursor()
+        sugerencias = sugerir_nombres(cur, campo, prefijo)
+        cur.close()
+
+    resp = jsonify({"campo": campo, "q": prefijo, "sugerencias": sugerencias})
+    resp.headers["Cache-Control"] = "private, max-age=30"
+    return resp
+
 # ============================================================
 #  REGISTRAR INTENCIÓN
 # ============================================================
 
-@app.route("/funcionario/registrar", methods=["POST"])
-@login_required()
-def funcionario_registrar():
-    misa_id = int(request.form["misa_id"])
-    categoria_id = int(request.form["categoria_id"])
-    ofrece = request.form["ofrece"].strip()
+# IDs REALES QUE DEFINISTE
+ID_DIFUNTOS = 1
+ID_SALUD = 2
+
+REGISTRO_LOTE_MAX = 100     # nombres por envío en el registro por lista
+
+INSERTAR_INTENCION = """
+    INSERT INTO intenciones(
+        misa_id, categoria_id, ofrece, intencion_base_id,
+        peticiones, fecha_creado, fecha_actualizado,
+        funcionario_id
+    )
+    VALUES (?,?,?,?,?,?,?,?)
+"""
 
-    # IDs REALES QUE DEFINISTE
-    ID_DIFUNTOS = 1
-    ID_SALUD = 2
 
-    raw_int_base = request.form.get("int_base_id", "").strip()
-    raw_peticiones = request.form.get("peticiones", "").strip()[:250]
+def campos_por_categoria(categoria_id, raw_int_base, raw_peticiones):
+    """(int_base_id, peticiones, error) según las reglas de la categoría."""
+    raw_int_base = raw_int_base.strip()
+    raw_peticiones = raw_peticiones.strip()[:250]
 
     # ================================
     # CATEGORÍAS SIN BASE NI PETICIONES
     # (DIFUNTOS y SALUD)
     # ================================
     if categoria_id in (ID_DIFUNTOS, ID_SALUD):
-        int_base_id = None
-        peticiones = ""
+        return None, "", None
 
     # ================================
     # OTRAS CATEGORÍAS (NORMALES)
     # ================================
-    else:
-        if raw_int_base == "":
-            flash("Debe seleccionar la intención base.")
-            return redirect("/funcionario")
+    if raw_int_base == "":
+        return None, None, "Debe seleccionar la intención base."
+
+    return int(raw_int_base), raw_peticiones, None
+
+
+@app.route("/funcionario/registrar", methods=["POST"])
+@login_required()
+def funcionario_registrar():
+    misa_id = int(request.form["misa_id"])
+    categoria_id = int(request.form["categoria_id"])
+    ofrece = request.form["ofrece"].strip()
 
-        int_base_id = int(raw_int_base)
-        peticiones = raw_peticiones
+    int_base_id, peticiones, error = campos_por_categoria(
+        categoria_id, request.form.get("int_base_id", ""), request.form.get("peticiones", ""))
+    if error:
+        flash(error)
+        return redirect("/funcionario")
 
     # ================================
     # VALIDACIONES GENERALES
@@ -695,15 +2853,10 @@ def funcionario_registrar():
     # ================================
     # INSERT
     # ================================
-    cur.execute("""
-        INSERT INTO intenciones(
-            misa_id, categoria_id, ofrece, intencion_base_id,
-            peticiones, fecha_creado, fecha_actualizado,
-            funcionario_id
-        )
-        VALUES (?,?,?,?,?,?,?,?)
-    """, (misa_id, categoria_id, ofrece, int_base_id, peticiones,
-          ahora, ahora, session["user_id"]))
+    cur.execute(INSERTAR_INTENCION, (misa_id, categoria_id, ofrece, int_base_id, peticiones,
+                                     ahora, ahora, session["user_id"]))
+    contar_nombres(cur, "ofrece", "", ofrece)
+    contar_nombres(cur, "peticiones", "", peticiones)
 
     conn.commit()
     conn.close()
@@ -711,6 +2864,77 @@ def funcionario_registrar():
     flash("✅ Intención registrada exitosamente.")
     return redirect("/funcionario")
 
+# ============================================================
+#  REGISTRAR VARIAS INTENCIONES (lista de nombres)
+# ============================================================
+# Una familia trae 15 difuntos para la misma misa: un nombre por línea en el
+# formulario, o JSON {"misa_id", "categoria_id", "int_base_id", "peticiones",
+# "nombres": [...]}. Mismas reglas que el registro individual y un solo
+# INSERT (executemany) en una transacción: o quedan todas o ninguna.
+
+@app.route("/funcionario/registrar_lote", methods=["POST"])
+@login_required()
+def funcionario_registrar_lote():
+    es_json = request.is_json
+    datos = (request.get_json(silent=True) or {}) if es_json else request.form
+
+    def fallar(mensaje):
+        if es_json:
+            return jsonify({"error": mensaje}), 400
+        flash(mensaje)
+        return redirect("/funcionario")
+
+    try:
+        misa_id = int(datos.get("misa_id"))
+        categoria_id = int(datos.get("categoria_id"))
+    except (TypeError, ValueError):
+        return fallar("Debe seleccionar la misa y la categoría.")
+    if categoria_id not in referencia()["categorias_por_id"]:
+        return fallar("Categoría no encontrada")
+
+    nombres = datos.get("nombres") or []
+    if isinstance(nombres, str):
+        nombres = nombres.splitlines()
+    nombres = [n.strip() for n in nombres if isinstance(n, str) and n.strip()]
+
+    if not nombres:
+        return fallar("Debe escribir al menos un nombre.")
+    if len(nombres) > REGISTRO_LOTE_MAX:
+        return fallar(f"Máximo {REGISTRO_LOTE_MAX} nombres por envío.")
+
+    try:
+        int_base_id, peticiones, error = campos_por_categoria(
+            categoria_id, str(datos.get("int_base_id") or ""), str(datos.get("peticiones") or ""))
+    except ValueError:
+        return fallar("Intención base inválida.")
+    if error:
+        return fallar(error)
+    if int_base_id is not None and int_base_id not in {b["id"] for b in referencia()["frases_activas"]}:
+        return fallar("Intención base inválida.")
+
+    conn = get_db(); cur = conn.cursor()
+
+    cur.execute("SELECT id FROM misas WHERE id=?", (misa_id,))
+    if not cur.fetchone():
+        conn.close()
+        return fallar("Misa no encontrada")
+
+    ahora = datetime.now().isoformat()
+    cur.executemany(INSERTAR_INTENCION, [
+        (misa_id, categoria_id, ofrece, int_base_id, peticiones, ahora, ahora, session["user_id"])
+        for ofrece in nombres
+    ])
+    sumar_nombres(cur, "ofrece", nombres)
+    sumar_nombres(cur, "peticiones", [peticiones] * len(nombres))
+
+    conn.commit()
+    conn.close()
+
+    if es_json:
+        return jsonify({"registradas": len(nombres), "misa_id": misa_id}), 201
+    flash(f"✅ {len(nombres)} intenciones registradas exitosamente.")
+    return redirect("/funcionario")
+
 # ============================================================
 #  EDITAR INTENCIÓN
 # ============================================================
@@ -754,8 +2978,7 @@ def funcionario_editar(int_id):
         categoria_id = int(request.form["categoria_id"])
 
         # Obtener texto real de la categoría
-        cur.execute("SELECT nombre FROM categorias WHERE id=?", (categoria_id,))
-        cat = cur.fetchone()
+        cat = referencia()["categorias_por_id"].get(categoria_id)
         cat_text = cat["nombre"].upper() if cat else ""
 
         es_difuntos = "DIFUN" in cat_text
@@ -801,6 +3024,8 @@ def funcionario_editar(int_id):
             datetime.now().isoformat(),
             int_id
         ))
+        contar_nombres(cur, "ofrece", row["ofrece"], ofrece)
+        contar_nombres(cur, "peticiones", row["peticiones"], peticiones)
 
         conn.commit()
         conn.close()
@@ -811,11 +3036,9 @@ def funcionario_editar(int_id):
     # ============================================================
     #                     PROCESO GET (cargar página)
     # ============================================================
-    cur.execute("SELECT * FROM categorias WHERE active=1 ORDER BY nombre")
-    categorias = cur.fetchall()
-
-    cur.execute("SELECT * FROM intencion_base WHERE active=1 ORDER BY frase")
-    int_b = cur.fetchall()
+    ref = referencia()
+    categorias = sorted(ref["categorias_activas"], key=lambda c: c["nombre"])
+    int_b = ref["frases_activas"]
 
     conn.close()
 
@@ -836,71 +3059,459 @@ def funcionario_export_csv():
     desde = request.form["desde"]
     hasta = request.form["hasta"]
 
-    conn = get_db(); cur = conn.cursor()
-    cur.execute("""
+    conn = get_db()
+
+    # Si el rango llega al archivo histórico, se adjuntan esos años y se suman
+    # con UNION ALL; se sueltan cuando termina la descarga
+    adjuntos = ExitStack()
+    try:
+        esquemas = adjuntos.enter_context(con_archivo(conn, anios_para_rango(desde, hasta)))
+    except ValueError as e:
+        adjuntos.close()
+        flash(f"❌ {e} Exporte por partes.")
+        return redirect("/funcionario")
+
+    consulta = " UNION ALL ".join(f"""
         SELECT i.*, c.nombre as categoria, b.frase as int_base,
                m.fecha as misa_fecha, m.hora as misa_hora
-        FROM intenciones i
+        FROM {esquema}.intenciones i
         LEFT JOIN categorias c ON c.id=i.categoria_id
         LEFT JOIN intencion_base b ON b.id=i.intencion_base_id
-        LEFT JOIN misas m ON m.id=i.misa_id
+        LEFT JOIN {esquema}.misas m ON m.id=i.misa_id
         WHERE i.funcionario_id=? AND date(m.fecha) BETWEEN date(?) AND date(?)
-    """, (session["user_id"], desde, hasta))
-
-    rows = cur.fetchall()
-    conn.close()
+    """ for esquema in esquemas + ["main"])
+    cur = conn.cursor()
+    cur.execute(consulta, (session["user_id"], desde, hasta) * (len(esquemas) + 1))
 
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["misa_fecha","misa_hora","categoria","ofrece",
-                     "intencion_base","peticiones",
-                     "fecha_creado","fecha_actualizado"])
+    encabezados = ["misa_fecha","misa_hora","categoria","ofrece",
+                   "intencion_base","peticiones",
+                   "fecha_creado","fecha_actualizado"]
 
-    for r in rows:
-        writer.writerow([
+    def fila(r):
+        return [
             r["misa_fecha"], r["misa_hora"], r["categoria"], r["ofrece"],
             r["int_base"], r["peticiones"],
             r["fecha_creado"], r["fecha_actualizado"]
-        ])
+        ]
 
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode("utf-8")),
-        mimetype="text/csv",
-        as_attachment=True,
-        download_name="mis_intenciones.csv"
-    )
+    return respuesta_csv(cur, encabezados, fila, "mis_intenciones.csv", al_terminar=adjuntos.close)
+
+# ============================================================
+#  BÚSQUEDA DE INTENCIONES (texto completo)
+# ============================================================
+# "¿Ya registraron a la familia Orjuela?": busca en ofrece y peticiones de
+# todas las intenciones con el índice intenciones_fts, ordenado por
+# relevancia (bm25). Cada palabra debe aparecer; la última vale como prefijo.
+
+BUSQUEDA_POR_PAGINA = 25
+MARCA_INICIO, MARCA_FIN = "\x02", "\x03"
+
+
+def consulta_fts(texto):
+    """Convierte lo que escribe el usuario en una consulta FTS5 segura."""
+    palabras = re.findall(r"\w+", texto)
+    if not palabras:
+        return None
+    terminos = ['"' + p.replace('"', '""') + '"' for p in palabras]
+    terminos[-1] += "*"
+    return " ".join(terminos)
+
+
+def resaltar(texto):
+    # Escapar el HTML y convertir las marcas de highlight() en <mark>
+    html = str(escape(texto or ""))
+    return Markup(html.replace(MARCA_INICIO, "<mark>").replace(MARCA_FIN, "</mark>"))
+
+
+def buscar_intenciones(cur, texto, pagina, desde="", hasta="", esquemas=()):
+    """Devuelve (filas, hay_siguiente) de la página pedida.
+
+    `esquemas`: años del archivo ya adjuntos que también se consultan.
+    """
+    consulta = consulta_fts(texto)
+    if consulta is None:
+        return [], False
+
+    partes, params = [], []
+    for esquema in ["main", *esquemas]:
+        partes.append(f"""
+            SELECT i.id, i.misa_id,
+                   highlight(intenciones_fts, 0, '{MARCA_INICIO}', '{MARCA_FIN}') AS ofrece,
+                   highlight(intenciones_fts, 1, '{MARCA_INICIO}', '{MARCA_FIN}') AS peticiones,
+                   m.fecha AS misa_fecha, m.hora AS misa_hora, m.ampm AS misa_ampm,
+                   c.nombre AS categoria, u.username AS funcionario,
+                   intenciones_fts.rank AS relevancia
+            FROM {esquema}.intenciones_fts
+            JOIN {esquema}.intenciones i ON i.id = intenciones_fts.rowid
+            LEFT JOIN {esquema}.misas m ON m.id = i.misa_id
+            LEFT JOIN categorias c ON c.id = i.categoria_id
+            LEFT JOIN users u ON u.id = i.funcionario_id
+            WHERE intenciones_fts MATCH ?
+              AND (? = '' OR m.fecha >= ?) AND (? = '' OR m.fecha <= ?)
+        """)
+        params += [consulta, desde, desde, hasta, hasta]
+
+    cur.execute(" UNION ALL ".join(partes) + """
+        ORDER BY relevancia, misa_fecha DESC
+        LIMIT ? OFFSET ?
+    """, params + [BUSQUEDA_POR_PAGINA + 1, (pagina - 1) * BUSQUEDA_POR_PAGINA])
+    filas = cur.fetchall()
+    return filas[:BUSQUEDA_POR_PAGINA], len(filas) > BUSQUEDA_POR_PAGINA
+
+
+@app.route("/buscar")
+@login_required()
+def buscar():
+    if session.get("role") not in ("funcionario", "admin"):
+        return "Acceso denegado", 403
+
+    q = request.args.get("q", "").strip()
+    desde = request.args.get("desde", "").strip()
+    hasta = request.args.get("hasta", "").strip()
+    try:
+        pagina = max(1, int(request.args.get("pagina", 1)))
+    except ValueError:
+        pagina = 1
+
+    # Sin "desde" se busca solo en la base actual; el archivo histórico se
+    # adjunta cuando el rango empieza antes de archivo_hasta
+    filas, hay_siguiente, error = [], False, None
+    if q:
+        conn = get_db()
+        try:
+            with con_archivo(conn, anios_para_rango(desde, hasta) if desde else []) as esquemas:
+                cur = conn.cursor()
+                filas, hay_siguiente = buscar_intenciones(cur, q, pagina, desde, hasta, esquemas)
+                cur.close()
+        except ValueError as e:
+            error = f"{e} Acote el rango de fechas."
+
+    if request.args.get("formato") == "json":
+        if error:
+            return jsonify({"error": error}), 400
+        limpiar = lambda t: (t or "").replace(MARCA_INICIO, "").replace(MARCA_FIN, "")
+        return jsonify({
+            "q": q,
+            "pagina": pagina,
+            "hay_siguiente": hay_siguiente,
+            "resultados": [{
+                "id": r["id"], "misa_fecha": r["misa_fecha"], "misa_hora": r["misa_hora"],
+                "misa_ampm": r["misa_ampm"], "categoria": r["categoria"],
+                "ofrece": limpiar(r["ofrece"]), "peticiones": limpiar(r["peticiones"]),
+                "funcionario": r["funcionario"],
+            } for r in filas],
+        })
+
+    if error:
+        flash(f"❌ {error}")
+    return render_template("buscar.html", q=q, desde=desde, hasta=hasta, filas=filas,
+                           pagina=pagina, hay_siguiente=hay_siguiente, resaltar=resaltar,
+                           archivo_hasta=archivo_hasta())
 
 # ============================================================
 #  GENERAR PDF POR DÍA
 # ============================================================
 
-@app.route("/funcionario/print_day", methods=["POST"])
-@login_required()
-def funcionario_print_day():
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib import colors
-    from reportlab.platypus import Table, TableStyle, Paragraph
-    from reportlab.lib.styles import ParagraphStyle
-    from datetime import datetime
-    from textwrap import wrap
-    from reportlab.lib.units import cm
-    from reportlab.pdfgen import canvas as rl_canvas
-    import locale, io
-    from flask import send_file, session
+# ReportLab se carga la primera vez que se genera un PDF, no al importar la
+# aplicación: los workers arrancan más rápido y no lo cargan si no imprimen.
 
-    dia = request.form["dia"]
-    conn = get_db()
-    cur = conn.cursor()
+_pdf_lib = {"ns": None}
+_pdf_lib_lock = threading.Lock()
 
-    # === TEXTO GLOBAL ===
-    cur.execute("SELECT value FROM settings WHERE key='pdf_texto_global'")
-    row = cur.fetchone()
-    global_text = row["value"].strip() if row else ""
 
-    # === MISAS DEL DÍA ===
-    cur.execute("SELECT * FROM misas WHERE fecha=? ORDER BY hora", (dia,))
-    misas = cur.fetchall()
+def pdf_lib():
+    """Módulos de ReportLab usados en los PDF (importados una sola vez)."""
+    if _pdf_lib["ns"] is not None:
+        return _pdf_lib["ns"]
+
+    with _pdf_lib_lock:
+        if _pdf_lib["ns"] is None:
+            from reportlab import rl_config
+            from reportlab.lib import colors
+            from reportlab.lib.pagesizes import letter
+            from reportlab.lib.styles import ParagraphStyle
+            from reportlab.lib.units import cm
+            from reportlab.lib.utils import ImageReader
+            from reportlab.pdfgen import canvas
+            from reportlab.platypus import Table, TableStyle, Paragraph
+
+            # Streams binarios en el PDF: ReportLab codifica ASCII85 en Python puro, que
+            # era la mayor parte del tiempo de generación (y agrandaba las imágenes).
+            rl_config.useA85 = 0
+
+            class CanvasPaginado(canvas.Canvas):
+                """Canvas que dibuja el pie "Página X de Y" al guardar.
+
+                showPage() solo guarda el estado de cada página; save() las cierra todas
+                llamando a pie(c, num, total), así el documento se arma en una sola pasada.
+                """
+
+                def __init__(self, *args, pie=None, **kwargs):
+                    super().__init__(*args, **kwargs)
+                    self._pie = pie
+                    self._paginas = []
+
+                def showPage(self):
+                    self._paginas.append(dict(self.__dict__))
+                    self._startPage()
+
+                def save(self):
+                    if len(self._code):
+                        self._paginas.append(dict(self.__dict__))
+
+                    total = len(self._paginas)
+                    for num, estado in enumerate(self._paginas, start=1):
+                        self.__dict__.update(estado)
+                        if self._pie:
+                            self._pie(self, num, total)
+                        canvas.Canvas.showPage(self)
+
+                    canvas.Canvas.save(self)
+
+            _pdf_lib["ns"] = SimpleNamespace(
+                canvas=canvas, CanvasPaginado=CanvasPaginado, letter=letter, cm=cm,
+                colors=colors, ImageReader=ImageReader,
+                Table=Table, TableStyle=TableStyle, Paragraph=Paragraph,
+                ParagraphStyle=ParagraphStyle,
+            )
+    return _pdf_lib["ns"]
+
+
+# ============================================================
+#  CACHÉ DE PDF EN DISCO (compartida entre workers)
+# ============================================================
+# El cuerpo del PDF se guarda con el nombre del hash de sus datos; si cambia
+# cualquier misa, intención, categoría, frase o el texto global del día, el
+# hash cambia y el PDF se vuelve a generar. La línea "IMPRESO POR" va en un
+# formulario (XObject) que se reemplaza en cada petición.
+
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR", os.path.join(APP_DIR, "cache", "pdf"))
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_MB", "200")) * 1024 * 1024
+PDF_LAYOUT_VERSION = "2"   # subir al cambiar el diseño del PDF
+FORM_PIE_IMPRESO = "pie_impreso"
+
+
+def huella_pdf_dia(dia, global_text, misas, items):
+    datos = [
+        PDF_LAYOUT_VERSION,
+        dia,
+        global_text,
+        [tuple(m) for m in misas],
+        [tuple(it) for it in items],
+    ]
+    return hashlib.sha256(json.dumps(datos, default=str).encode("utf-8")).hexdigest()
+
+
+def _ruta_pdf_cache(huella):
+    return os.path.join(PDF_CACHE_DIR, huella + ".pdf")
+
+
+def leer_pdf_cache(huella):
+    ruta = _ruta_pdf_cache(huella)
+    try:
+        with open(ruta, "rb") as f:
+            data = f.read()
+        os.utime(ruta)   # la fecha de modificación marca el último uso (LRU)
+        return data
+    except OSError:
+        return None
+
+
+def guardar_pdf_cache(huella, data):
+    try:
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=PDF_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, _ruta_pdf_cache(huella))
+        _podar_pdf_cache()
+    except OSError as e:
+        app.logger.warning("No se pudo guardar el PDF en caché: %s", e)
+
+
+def _podar_pdf_cache():
+    archivos = []
+    total = 0
+    for entrada in os.scandir(PDF_CACHE_DIR):
+        if not entrada.name.endswith(".pdf"):
+            continue
+        try:
+            st = entrada.stat()
+        except OSError:
+            continue
+        archivos.append((st.st_mtime, st.st_size, entrada.path))
+        total += st.st_size
+
+    # Borrar los menos usados hasta quedar bajo el límite
+    archivos.sort()
+    for _, tam, ruta in archivos:
+        if total <= PDF_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+        total -= tam
+
+
+def _texto_pdf(texto):
+    # Cadena literal PDF en WinAnsi (Helvetica), con escapes octales
+    salida = []
+    for b in texto.encode("cp1252", "replace"):
+        if b in b"()\\" or b < 32 or b > 126:
+            salida.append(f"\\{b:03o}")
+        else:
+            salida.append(chr(b))
+    return "(" + "".join(salida) + ")"
+
+
+def estampar_pie_impreso(pdf, texto):
+    """Devuelve el PDF con el formulario del pie reemplazado por `texto`.
+
+    pypdf en modo incremental: se agrega al final una nueva versión del
+    formulario y una nueva tabla xref, sin reescribir el resto del archivo.
+    """
+    from pypdf import PdfWriter
+    from pypdf.generic import NameObject
+
+    escritor = PdfWriter(io.BytesIO(pdf), incremental=True)
+    xobjetos = escritor.pages[0]["/Resources"]["/XObject"]
+    form = next(v.get_object() for k, v in xobjetos.items() if k.endswith(FORM_PIE_IMPRESO))
+    fuentes = form["/Resources"]["/Font"].get_object()
+    fuente = next(k for k, f in fuentes.items() if f.get_object()["/BaseFont"] == "/Helvetica")
+    form.get_data()   # decodifica el contenido actual, con el filtro que traiga
+    form[NameObject("/Filter")] = NameObject("/FlateDecode")
+    form.set_data((f".3 g BT {fuente} 8 Tf 1 0 0 1 100 55 Tm "
+                   f"{_texto_pdf(texto)} Tj ET").encode("latin-1"))
+
+    salida = io.BytesIO()
+    escritor.write(salida)
+    return salida.getvalue()
+
+
+# ============================================================
+#  IMÁGENES DEL PDF (se decodifican una vez por proceso)
+# ============================================================
+# El borde y el título se cargan desde APP_DIR/static la primera vez, se
+# reducen si superan PDF_IMAGEN_DPI al tamaño impreso y se dibujan una sola
+# vez por documento dentro de un formulario que cada página solo referencia.
+
+PDF_IMAGEN_DPI = 150
+FORM_FONDO = "fondo_pagina"
+
+_imagenes_pdf = {}
+_imagenes_lock = threading.Lock()
+
+
+def imagen_pdf(nombre, ancho_pt, alto_pt):
+    clave = (nombre, ancho_pt, alto_pt)
+    img = _imagenes_pdf.get(clave)
+    if img is not None:
+        return img
+
+    with _imagenes_lock:
+        img = _imagenes_pdf.get(clave)
+        if img is None:
+            from PIL import Image
+
+            im = Image.open(os.path.join(APP_DIR, "static", nombre))
+            max_w = round(ancho_pt / 72 * PDF_IMAGEN_DPI)
+            max_h = round(alto_pt / 72 * PDF_IMAGEN_DPI)
+            if im.width > max_w or im.height > max_h:
+                im = im.resize((min(im.width, max_w), min(im.height, max_h)), Image.LANCZOS)
+            else:
+                im.load()
+
+            img = pdf_lib().ImageReader(im)
+            img.getRGBData()   # decodificar ahora y no en cada documento
+            _imagenes_pdf[clave] = img
+    return img
+
+
+def definir_fondo_pdf(c, w, h):
+    c.beginForm(FORM_FONDO)
+    try:
+        c.drawImage(imagen_pdf("borde.png", w, h), 0, 0, width=w, height=h, mask="auto")
+        c.drawImage(imagen_pdf("titulo.png", 400, 65), (w - 400) / 2, h - 110,
+                    width=400, height=65, mask="auto")
+    except OSError as e:
+        app.logger.warning("No se pudieron cargar las imágenes del PDF: %s", e)
+    c.endForm()
+
+
+# ============================================================
+#  PDF DEL DÍA
+# ============================================================
+
+DIAS_ES = {"Monday": "LUNES","Tuesday": "MARTES","Wednesday": "MIÉRCOLES",
+           "Thursday": "JUEVES","Friday": "VIERNES","Saturday": "SÁBADO","Sunday": "DOMINGO"}
+MESES_ES = {"January": "ENERO","February": "FEBRERO","March": "MARZO","April": "ABRIL",
+            "May": "MAYO","June": "JUNIO","July": "JULIO","August": "AGOSTO",
+            "September": "SEPTIEMBRE","October": "OCTUBRE","November": "NOVIEMBRE","December": "DICIEMBRE"}
+
+
+def fecha_larga(dt):
+    return f"{DIAS_ES[dt.strftime('%A')]} {dt.day} DE {MESES_ES[dt.strftime('%B')]} DE {dt.year}"
+
+
+def texto_impreso(usuario):
+    # Ajustamos zona horaria Colombia (UTC-5)
+    now = datetime.utcnow() - timedelta(hours=5)
+    hora_imp = now.strftime("%I:%M %p").upper()
+    return f"IMPRESO POR: {usuario} — {fecha_larga(now)} A LAS {hora_imp}"
+
+
+def datos_pdf_dia(cur, dia):
+    """Misas, intenciones (agrupadas por misa) y texto global de un día."""
+    with fase_pdf("consulta"):
+        # === TEXTO GLOBAL ===
+        global_text = (referencia()["settings"].get("pdf_texto_global") or "").strip()
+
+        # === MISAS DEL DÍA ===
+        cur.execute("SELECT * FROM misas WHERE fecha=? ORDER BY minutos", (dia,))
+        misas = cur.fetchall()
+
+        # === INTENCIONES DEL DÍA (una sola consulta, agrupadas por misa) ===
+        cur.execute("""
+            SELECT i.*, c.nombre AS cat, c.texto_adicional AS cat_text, b.frase AS base
+            FROM intenciones i
+            JOIN misas m ON m.id=i.misa_id
+            LEFT JOIN categorias c ON c.id=i.categoria_id
+            LEFT JOIN intencion_base b ON b.id=i.intencion_base_id
+            WHERE m.fecha=?
+            ORDER BY i.misa_id, c.orden ASC, i.fecha_creado ASC, i.id ASC
+        """, (dia,))
+        items_por_misa = {}
+        for it in cur.fetchall():
+            items_por_misa.setdefault(it["misa_id"], []).append(it)
+
+    huella = huella_pdf_dia(dia, global_text, misas,
+                            [it for items in items_por_misa.values() for it in items])
+    return {"dia": dia, "global_text": global_text, "misas": misas,
+            "items_por_misa": items_por_misa, "huella": huella}
+
+
+def pie_pagina(c, num, total):
+    # "IMPRESO POR" va en un formulario que se estampa por petición
+    w = c._pagesize[0]
+    c.setFont("Helvetica", 8)
+    c.setFillGray(0.3)
+    c.doForm(FORM_PIE_IMPRESO)
+    c.drawRightString(w - 100, 55, f"Página {num} de {total}")
+    c.setFillGray(0)
+
+
+def dibujar_dia(c, datos):
+    """Dibuja las misas del día en `c` a partir de su página actual (una sola pasada)."""
+    rl = pdf_lib()
+    Table, TableStyle, Paragraph = rl.Table, rl.TableStyle, rl.Paragraph
+    ParagraphStyle, colors, cm = rl.ParagraphStyle, rl.colors, rl.cm
+
+    w, h = c._pagesize
+    misas = datos["misas"]
+    items_por_misa = datos["items_por_misa"]
+    global_text = datos["global_text"]
+    fecha_formateada = fecha_larga(datetime.strptime(datos["dia"], "%Y-%m-%d"))
 
     # ======= Helpers =======
     line_height = 10
@@ -911,302 +3522,564 @@ def funcionario_print_day():
     small_style = ParagraphStyle(name="SmallStyle", fontName="Helvetica", fontSize=7, leading=9)
     header_style = ParagraphStyle(name="HeaderStyle", fontName="Helvetica-Bold", fontSize=9, alignment=1, leading=11)
 
-    dias = {"Monday": "LUNES","Tuesday": "MARTES","Wednesday": "MIÉRCOLES",
-            "Thursday": "JUEVES","Friday": "VIERNES","Saturday": "SÁBADO","Sunday": "DOMINGO"}
-    meses = {"January": "ENERO","February": "FEBRERO","March": "MARZO","April": "ABRIL",
-             "May": "MAYO","June": "JUNIO","July": "JULIO","August": "AGOSTO",
-             "September": "SEPTIEMBRE","October": "OCTUBRE","November": "NOVIEMBRE","December": "DICIEMBRE"}
+    def fondo_encabezado_on(c):
+        # Borde y título: formulario definido una vez por documento
+        c.doForm(FORM_FONDO)
 
-    fecha_dt = datetime.strptime(dia, "%Y-%m-%d")
-    fecha_formateada = f"{dias[fecha_dt.strftime('%A')]} {fecha_dt.day} DE {meses[fecha_dt.strftime('%B')]} DE {fecha_dt.year}"
+    fondo_encabezado_on(c)
 
-    # ======= Primera pasada: contar páginas =======
-    class CountingCanvas(rl_canvas.Canvas):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-            self.page_count = 1
+    # 🔥 TÍTULO SOLO EN LA PRIMERA PÁGINA
+    c.setFont("Helvetica-Bold", 11)
+    c.drawCentredString(w/2, h - 130, f"INTENCIONES PARA LA SANTA MISA — {fecha_formateada}")
 
-        def showPage(self):
-            self.page_count += 1
-            super().showPage()
+    y_loc = h - 160
+    c.setFont("Helvetica", 8)
 
-    # Encabezado y pie
-    def fondo_encabezado_on(c):
-        try:
-            c.saveState()
-            c.drawImage("static/borde.png", 0, 0, width=w, height=h, mask="auto")
-            c.drawImage("static/titulo.png", (w - 400) / 2, h - 110,
-                        width=400, height=65, mask="auto")
-            c.restoreState()
-        except:
-            pass
+    def make_new_page():
+        nonlocal y_loc
 
-    def pie_pagina_on(c, num, total):
-        usuario = session.get("username", "N/A")
-        # Ajustamos zona horaria Colombia (UTC-5)
-        now = datetime.utcnow() - timedelta(hours=5)
-    
-        dia_imp = dias[now.strftime("%A")]
-        mes_imp = meses[now.strftime("%B")]
-        hora_imp = now.strftime("%I:%M %p").upper()
-        fecha_imp = f"{dia_imp} {now.day} DE {mes_imp} DE {now.year} A LAS {hora_imp}"
-    
-        c.setFont("Helvetica", 8)
-        c.setFillGray(0.3)
-        c.drawString(100, 55, f"IMPRESO POR: {usuario} — {fecha_imp}")
-        c.drawRightString(w - 100, 55, f"Página {num} de {total}")
-        c.setFillGray(0)
-
-    # ======= Renderizador general (ambas pasadas) =======
-    def render_content(c, count_only=False, page_state=None, total_pages=None):
-        nonlocal w, h
-    
+        # El pie "Página X de Y" lo agrega CanvasPaginado al guardar
+        c.showPage()
         fondo_encabezado_on(c)
 
-        # 🔥 TÍTULO SOLO EN LA PRIMERA PÁGINA REAL
-        if count_only or (not count_only and page_state['current'] == 1 and c.getPageNumber() == 1):
-            c.setFont("Helvetica-Bold", 11)
-            c.drawCentredString(w/2, h - 130, f"INTENCIONES PARA LA SANTA MISA — {fecha_formateada}")
-    
         y_loc = h - 160
         c.setFont("Helvetica", 8)
-    
-        def make_new_page():
-            nonlocal y_loc
-        
-            if count_only:
-                c.showPage()
-                fondo_encabezado_on(c)
-                c.setFont("Helvetica-Bold", 11)
-                c.drawCentredString(w/2, h - 130, f"INTENCIONES PARA LA SANTA MISA — {fecha_formateada}")
-                y_loc = h - 160
-                c.setFont("Helvetica", 8)
-        
+
+    # ==== Recorrer misas ====
+    for misa in misas:
+        c.setFont("Helvetica-Bold", 12)
+        c.drawString(50, y_loc, f"MISA {misa['hora']} {misa['ampm']}")
+        y_loc -= 18
+
+        items = items_por_misa.get(misa["id"], [])
+
+        if not items:
+            c.setFont("Helvetica", 10)
+            c.drawString(70, y_loc, "No hay intenciones registradas.")
+            y_loc -= 25
+            continue
+
+        # Agrupar categorías
+        categorias_local = []
+        for it in items:
+            cat = it["cat_text"] or it["cat"] or "SIN CATEGORÍA"
+            if not categorias_local or categorias_local[-1][0] != cat:
+                categorias_local.append((cat, [it]))
             else:
-                # Pie de página antes de pasar
-                pie_pagina_on(c, page_state['current'], total_pages)
-                c.showPage()
-        
-                # 🔥 IMPORTANTE: incrementar antes de dibujar
-                page_state['current'] += 1
-        
-                fondo_encabezado_on(c)
-        
-                # 🔥 SOLO página 1
-                if page_state['current'] == 1:
-                    c.setFont("Helvetica-Bold", 11)
-                    c.drawCentredString(w/2, h - 130, f"INTENCIONES PARA LA SANTA MISA — {fecha_formateada}")
-        
-                y_loc = h - 160
-                c.setFont("Helvetica", 8)
+                categorias_local[-1][1].append(it)
 
-        # ==== Recorrer misas ====
-        for misa in misas:
-            c.setFont("Helvetica-Bold", 12)
-            c.drawString(50, y_loc, f"MISA {misa['hora']} {misa['ampm']}")
-            y_loc -= 18
+        # Categorías
+        for cat_nombre, cat_items in categorias_local:
+            nombre_upper = (cat_nombre or "").upper().strip()
+            cat_real = (cat_items[0]["cat"] or "").upper().strip()
 
-            cur.execute("""
-                SELECT i.*, c.nombre AS cat, c.texto_adicional AS cat_text, b.frase AS base
-                FROM intenciones i
-                LEFT JOIN categorias c ON c.id=i.categoria_id
-                LEFT JOIN intencion_base b ON b.id=i.intencion_base_id
-                WHERE i.misa_id=?
-                ORDER BY c.orden ASC, i.fecha_creado ASC
-            """, (misa["id"],))
-            items = cur.fetchall()
-
-            if not items:
-                c.setFont("Helvetica", 10)
-                c.drawString(70, y_loc, "No hay intenciones registradas.")
-                y_loc -= 25
+            c.setFont("Helvetica-Bold", 10)
+            c.drawString(50, y_loc, nombre_upper)
+            y_loc -= 15
+
+            # === DIFUNTOS ===
+            if "DIFUNT" in cat_real or "DIFUNT" in nombre_upper:
+            
+                # Construir filas de la tabla 3 columnas
+                data = []
+                fila = []
+            
+                for it in cat_items:
+                    fila.append(Paragraph(it["peticiones"] or "", small_style))
+                    if len(fila) == 3:
+                        data.append(fila)
+                        fila = []
+            
+                # Completar última fila si está incompleta
+                if fila:
+                    while len(fila) < 3:
+                        fila.append(Paragraph("", small_style))
+                    data.append(fila)
+            
+                # 🔥 FORZAR SIEMPRE 20 FILAS llenando con vacías
+                while len(data) < 20:
+                    data.append([
+                        Paragraph("", small_style),
+                        Paragraph("", small_style),
+                        Paragraph("", small_style)
+                    ])
+            
+                # Medidas
+                x_ini = 2 * cm
+                col_width = (w - 4 * cm) / 3
+            
+                # 🔥 ALTO FIJO PARA TODAS LAS FILAS
+                row_height = 14   # ajustable
+            
+                t = Table(
+                    data,
+                    colWidths=[col_width] * 3,
+                    rowHeights=[row_height] * len(data)   # 🔥 aquí se fija
+                )
+            
+                t.setStyle(TableStyle([
+                    ("GRID", (0,0), (-1,-1), 0.25, colors.lightgrey),
+                    ("VALIGN", (0,0), (-1,-1), "TOP"),
+                ]))
+            
+                # Calcular tamaño
+                w_table, h_table = t.wrapOn(c, w - 4*cm, y_loc)
+            
+                # Saltar página si no cabe
+                if y_loc - h_table < footer_limit:
+                    make_new_page()
+            
+                # Dibujar
+                t.drawOn(c, x_ini, y_loc - h_table)
+                y_loc -= h_table + 20
+            
                 continue
 
-            # Agrupar categorías
-            categorias_local = []
-            for it in items:
-                cat = it["cat_text"] or it["cat"] or "SIN CATEGORÍA"
-                if not categorias_local or categorias_local[-1][0] != cat:
-                    categorias_local.append((cat, [it]))
-                else:
-                    categorias_local[-1][1].append(it)
-
-            # Categorías
-            for cat_nombre, cat_items in categorias_local:
-                nombre_upper = (cat_nombre or "").upper().strip()
-                cat_real = (cat_items[0]["cat"] or "").upper().strip()
-
-                c.setFont("Helvetica-Bold", 10)
-                c.drawString(50, y_loc, nombre_upper)
-                y_loc -= 15
-
-                # === DIFUNTOS ===
-                if "DIFUNT" in cat_real or "DIFUNT" in nombre_upper:
-                
-                    # Construir filas de la tabla 3 columnas
-                    data = []
-                    fila = []
-                
-                    for it in cat_items:
-                        fila.append(Paragraph(it["peticiones"] or "", small_style))
-                        if len(fila) == 3:
-                            data.append(fila)
-                            fila = []
-                
-                    # Completar última fila si está incompleta
-                    if fila:
-                        while len(fila) < 3:
-                            fila.append(Paragraph("", small_style))
-                        data.append(fila)
-                
-                    # 🔥 FORZAR SIEMPRE 20 FILAS llenando con vacías
-                    while len(data) < 20:
-                        data.append([
-                            Paragraph("", small_style),
-                            Paragraph("", small_style),
-                            Paragraph("", small_style)
-                        ])
-                
-                    # Medidas
-                    x_ini = 2 * cm
-                    col_width = (w - 4 * cm) / 3
-                
-                    # 🔥 ALTO FIJO PARA TODAS LAS FILAS
-                    row_height = 14   # ajustable
-                
-                    t = Table(
-                        data,
-                        colWidths=[col_width] * 3,
-                        rowHeights=[row_height] * len(data)   # 🔥 aquí se fija
-                    )
-                
-                    t.setStyle(TableStyle([
-                        ("GRID", (0,0), (-1,-1), 0.25, colors.lightgrey),
-                        ("VALIGN", (0,0), (-1,-1), "TOP"),
-                    ]))
-                
-                    # Calcular tamaño
-                    w_table, h_table = t.wrapOn(c, w - 4*cm, y_loc)
-                
-                    # Saltar página si no cabe
-                    if y_loc - h_table < footer_limit:
-                        make_new_page()
-                
-                    # Dibujar
-                    t.drawOn(c, x_ini, y_loc - h_table)
-                    y_loc -= h_table + 20
-                
-                    continue
-
-                # === SALUD ===
-                elif "SALUD" in nombre_upper:
-                    texto = ", ".join([it["peticiones"] for it in cat_items])
-                    wrapped = wrap(texto, 100)
-                    needed_h = len(wrapped)*line_height + 20
+            # === SALUD ===
+            elif "SALUD" in nombre_upper:
+                texto = ", ".join([it["peticiones"] for it in cat_items])
+                wrapped = wrap(texto, 100)
+                needed_h = len(wrapped)*line_height + 20
+                if y_loc - needed_h < footer_limit:
+                    make_new_page()
+                c.setFont("Helvetica", 8)
+                for line in wrapped:
+                    c.drawString(60, y_loc, line)
+                    y_loc -= line_height
+                y_loc -= 10
+                continue
+
+            # === ACCIÓN DE GRACIAS ===
+            elif "GRACIAS" in nombre_upper:
+                data = [[Paragraph("PETICIONES", header_style),
+                         Paragraph("OFRECE", header_style)]]
+                for it in cat_items:
+                    data.append([
+                        Paragraph(it["peticiones"] or "", cell_style),
+                        Paragraph(it["ofrece"] or "", cell_style)
+                    ])
+                t = Table(data, colWidths=[(w-100)/2,(w-100)/2])
+                t.setStyle(TableStyle([
+                    ('GRID',(0,0),(-1,-1),0.5,colors.black),
+                    ('BACKGROUND',(0,0),(-1,0),colors.lightgrey),
+                ]))
+                w_table, h_table = t.wrapOn(c, w - 100, y_loc)
+                if y_loc - h_table < footer_limit:
+                    make_new_page()
+                t.drawOn(c, 50, y_loc - h_table)
+                y_loc -= h_table + 20
+                continue
+
+            # === VARIOS / OTRAS ===
+            else:
+                for it in cat_items:
+                    txt = (it["peticiones"] or "").strip()
+                    if it["ofrece"]:
+                        full = f"• {txt} — OFRECE: {it['ofrece']}"
+                    else:
+                        full = f"• {txt}"
+
+                    wrapped_item = wrap(full, 100)
+                    needed_h = len(wrapped_item)*line_height + 15
                     if y_loc - needed_h < footer_limit:
                         make_new_page()
                     c.setFont("Helvetica", 8)
-                    for line in wrapped:
+                    for line in wrapped_item:
                         c.drawString(60, y_loc, line)
                         y_loc -= line_height
-                    y_loc -= 10
-                    continue
-
-                # === ACCIÓN DE GRACIAS ===
-                elif "GRACIAS" in nombre_upper:
-                    data = [[Paragraph("PETICIONES", header_style),
-                             Paragraph("OFRECE", header_style)]]
-                    for it in cat_items:
-                        data.append([
-                            Paragraph(it["peticiones"] or "", cell_style),
-                            Paragraph(it["ofrece"] or "", cell_style)
-                        ])
-                    t = Table(data, colWidths=[(w-100)/2,(w-100)/2])
-                    t.setStyle(TableStyle([
-                        ('GRID',(0,0),(-1,-1),0.5,colors.black),
-                        ('BACKGROUND',(0,0),(-1,0),colors.lightgrey),
-                    ]))
-                    w_table, h_table = t.wrapOn(c, w - 100, y_loc)
-                    if y_loc - h_table < footer_limit:
-                        make_new_page()
-                    t.drawOn(c, 50, y_loc - h_table)
-                    y_loc -= h_table + 20
-                    continue
+                    y_loc -= 5
+                y_loc -= 10
 
-                # === VARIOS / OTRAS ===
-                else:
-                    for it in cat_items:
-                        txt = (it["peticiones"] or "").strip()
-                        if it["ofrece"]:
-                            full = f"• {txt} — OFRECE: {it['ofrece']}"
-                        else:
-                            full = f"• {txt}"
-
-                        wrapped_item = wrap(full, 100)
-                        needed_h = len(wrapped_item)*line_height + 15
-                        if y_loc - needed_h < footer_limit:
-                            make_new_page()
-                        c.setFont("Helvetica", 8)
-                        for line in wrapped_item:
-                            c.drawString(60, y_loc, line)
-                            y_loc -= line_height
-                        y_loc -= 5
-                    y_loc -= 10
-
-        # ===== TEXTO GLOBAL FINAL =====
-        if global_text:
-            y_loc -= 20
-        
-            margen_x = 2 * cm
-            ancho_texto = w - 4 * cm  # márgenes laterales 2cm
-        
-            # Título centrado
-            c.setFont("Helvetica-Bold", 10)
-            needed_h = 30
-            if y_loc - needed_h < footer_limit:
-                make_new_page()
-        
-            #c.drawCentredString(w/2, y_loc, "INTENCIONES ESPECIALES")
-            #y_loc -= 25
-        
-            # Texto global (negrilla, centrado)
-            c.setFont("Helvetica-Bold", 9)
-        
-            # Envolver respetando ancho permitido
-            wrapped_lines = wrap(" ".join(global_text.splitlines()),
-                                 width=int(ancho_texto / 5.5))
-        
-            needed_h = len(wrapped_lines) * 12 + 10
-            if y_loc - needed_h < footer_limit:
-                make_new_page()
-        
-            for line in wrapped_lines:
-                c.drawCentredString(w/2, y_loc, line)
-                y_loc -= 12
+    # ===== TEXTO GLOBAL FINAL =====
+    if global_text:
+        y_loc -= 20
+    
+        margen_x = 2 * cm
+        ancho_texto = w - 4 * cm  # márgenes laterales 2cm
+    
+        # Título centrado
+        c.setFont("Helvetica-Bold", 10)
+        needed_h = 30
+        if y_loc - needed_h < footer_limit:
+            make_new_page()
+    
+        #c.drawCentredString(w/2, y_loc, "INTENCIONES ESPECIALES")
+        #y_loc -= 25
+    
+        # Texto global (negrilla, centrado)
+        c.setFont("Helvetica-Bold", 9)
+    
+        # Envolver respetando ancho permitido
+        wrapped_lines = wrap(" ".join(global_text.splitlines()),
+                             width=int(ancho_texto / 5.5))
+    
+        needed_h = len(wrapped_lines) * 12 + 10
+        if y_loc - needed_h < footer_limit:
+            make_new_page()
+    
+        for line in wrapped_lines:
+            c.drawCentredString(w/2, y_loc, line)
+            y_loc -= 12
 
-        return
 
-    # ===== PASADA 1 =====
-    buf_count = io.BytesIO()
-    counting = CountingCanvas(buf_count, pagesize=letter)
-    w, h = letter
-    render_content(counting, count_only=True)
-    counting.save()
-    total_pages = counting.page_count - 1
-
-    # ===== PASADA 2 =====
-    buf_final = io.BytesIO()
-    final_canvas = rl_canvas.Canvas(buf_final, pagesize=letter)
-    page_state = {'current': 1}
-    render_content(final_canvas, count_only=False, page_state=page_state, total_pages=total_pages)
-    pie_pagina_on(final_canvas, page_state['current'], total_pages)
-    final_canvas.save()
-
-    buf_final.seek(0)
+def nuevo_canvas_pdf(buf):
+    rl = pdf_lib()
+    c = rl.CanvasPaginado(buf, pagesize=rl.letter, pie=pie_pagina)
+    c.beginForm(FORM_PIE_IMPRESO)
+    c.endForm()
+    definir_fondo_pdf(c, *rl.letter)
+    return c
+
+
+def cuerpo_pdf_dia(datos):
+    """PDF del día sin el pie "IMPRESO POR", desde la caché o generado."""
+    with fase_pdf("cache"):
+        cuerpo = leer_pdf_cache(datos["huella"])
+    contar_pdf_cache("acierto" if cuerpo is not None else "fallo")
+    if cuerpo is not None:
+        return cuerpo
+
+    buf_cuerpo = io.BytesIO()
+    with fase_pdf("diseno"):
+        final_canvas = nuevo_canvas_pdf(buf_cuerpo)
+        dibujar_dia(final_canvas, datos)
+    with fase_pdf("serializacion"):
+        final_canvas.save()
+
+    cuerpo = buf_cuerpo.getvalue()
+    guardar_pdf_cache(datos["huella"], cuerpo)
+    return cuerpo
+
+
+def pdf_dia_impreso(cuerpo, usuario):
+    with fase_pdf("estampado"):
+        return estampar_pie_impreso(cuerpo, texto_impreso(usuario))
+
+
+@tipo_trabajo("pdf_dia", "PDF del día")
+def trabajo_pdf_dia(trabajo_id, params, progreso):
+    cur = get_db().cursor()
+    datos = datos_pdf_dia(cur, params["dia"])
+    cur.close()
+
+    pdf = pdf_dia_impreso(cuerpo_pdf_dia(datos), params["usuario"])
+    ruta = ruta_trabajo(trabajo_id, f"intenciones_{params['dia']}.pdf")
+    with open(ruta, "wb") as f:
+        f.write(pdf)
+    progreso(1, 1)
+    return ruta, None
+
+
+@app.route("/funcionario/print_day", methods=["POST"])
+@login_required()
+def funcionario_print_day():
+    dia = request.form["dia"]
+    try:
+        dia = date.fromisoformat(dia).isoformat()
+    except ValueError:
+        flash("❌ Fecha inválida.")
+        return redirect("/funcionario")
+
+    # Si el día ya está en la caché se entrega de inmediato; si hay que
+    # generarlo, se encola para no ocupar el worker web mientras se dibuja.
+    cur = get_db().cursor()
+    datos = datos_pdf_dia(cur, dia)
+    cur.close()
+
+    with fase_pdf("cache"):
+        cuerpo = leer_pdf_cache(datos["huella"])
+    if cuerpo is None:
+        return encolar_y_responder("pdf_dia", {"dia": dia, "usuario": session.get("username", "N/A")})
+    contar_pdf_cache("acierto")
+
+    buf_final = io.BytesIO(pdf_dia_impreso(cuerpo, session.get("username", "N/A")))
     return send_file(buf_final, mimetype="application/pdf",
                      as_attachment=True,
                      download_name=f"intenciones_{dia}.pdf")
 
+
+# ============================================================
+#  PDF DE VARIOS DÍAS (semana santa, semanas completas)
+# ============================================================
+# Cada día se dibuja con el mismo diseño de print_day, en un pool de procesos
+# (ReportLab es CPU puro y no libera el GIL). Los PDF de cada día se unen en
+# uno solo con pypdf, precedido de una portada con el índice; el pie
+# "IMPRESO POR" y la numeración (continua o por día) se agregan al unir.
+
+PDF_PROCESOS = int(os.environ.get("PDF_PROCESOS", "0")) or os.cpu_count() or 1
+PDF_RANGO_MAX_DIAS = 31
+NUMERACIONES_RANGO = ("continua", "por_dia")
+
+_pool_pdf = {"pid": None, "pool": None}
+_pool_pdf_lock = threading.Lock()
+
+
+def pool_pdf():
+    # "spawn": hacer fork desde un proceso con hilos puede dejar locks tomados
+    with _pool_pdf_lock:
+        if _pool_pdf["pid"] != os.getpid():
+            _pool_pdf["pool"] = ProcessPoolExecutor(
+                max_workers=PDF_PROCESOS, mp_context=multiprocessing.get_context("spawn"))
+            _pool_pdf["pid"] = os.getpid()
+        return _pool_pdf["pool"]
+
+
+def _descartar_pool_pdf():
+    with _pool_pdf_lock:
+        if _pool_pdf["pool"] is not None:
+            _pool_pdf["pool"].shutdown(wait=False, cancel_futures=True)
+        _pool_pdf["pid"] = _pool_pdf["pool"] = None
+
+
+def renderizar_dia_sin_pie(datos):
+    """PDF de un día sin pie (se agrega al unir). Corre en el pool de procesos."""
+    buf = io.BytesIO()
+    rl = pdf_lib()
+    c = rl.CanvasPaginado(buf, pagesize=rl.letter, pie=None)
+    definir_fondo_pdf(c, *rl.letter)
+    dibujar_dia(c, datos)
+    c.save()
+    return buf.getvalue()
+
+
+def _datos_serializables(datos):
+    # sqlite3.Row no se puede enviar a otro proceso
+    return {
+        "dia": datos["dia"],
+        "global_text": datos["global_text"],
+        "misas": [dict(m) for m in datos["misas"]],
+        "items_por_misa": {k: [dict(it) for it in v] for k, v in datos["items_por_misa"].items()},
+    }
+
+
+def cuerpos_pdf_rango(dias, progreso):
+    """PDF sin pie de cada día de `dias`, desde la caché o generados en paralelo."""
+    huellas = [hashlib.sha256((d["huella"] + ":rango").encode()).hexdigest() for d in dias]
+    cuerpos = [leer_pdf_cache(hu) for hu in huellas]
+    faltan = [i for i, cuerpo in enumerate(cuerpos) if cuerpo is None]
+
+    def listo(i, cuerpo):
+        cuerpos[i] = cuerpo
+        guardar_pdf_cache(huellas[i], cuerpo)
+        progreso(len(dias) - cuerpos.count(None), len(dias))
+
+    with fase_pdf("rango"):
+        if len(faltan) > 1 and PDF_PROCESOS > 1:
+            pool = pool_pdf()
+            try:
+                futuros = {pool.submit(renderizar_dia_sin_pie, _datos_serializables(dias[i])): i
+                           for i in faltan}
+                for futuro in as_completed(futuros):
+                    listo(futuros[futuro], futuro.result())
+            except Exception:
+                _descartar_pool_pdf()   # un proceso caído deja el pool inservible
+                raise
+        else:
+            for i in faltan:
+                listo(i, renderizar_dia_sin_pie(dias[i]))
+    return cuerpos
+
+
+PDF_UNIR_PASADAS = 3
+
+
+def contar_paginas_pdf(pdf):
+    from pypdf import PdfReader
+
+    return len(PdfReader(io.BytesIO(pdf)).pages)
+
+
+def dibujar_pie(c, impreso, numero=None):
+    """Pie de las páginas unidas: "IMPRESO POR" y, si se indica, el número de página."""
+    w = pdf_lib().letter[0]
+    c.setFillGray(.3)
+    c.setFont("Helvetica", 8)
+    c.drawString(100, 55, impreso)
+    if numero:
+        c.drawRightString(w - 100, 55, numero)
+
+
+def unir_pdfs(partes):
+    """Une varios PDF en uno. `partes` es una lista de (pdf, pie) donde
+    pie(n) devuelve los argumentos de dibujar_pie para la página n (o None).
+
+    Los pies se dibujan en un PDF aparte, una página por página del
+    resultado, y se superponen. Los objetos idénticos entre documentos
+    (imágenes del fondo, fuentes) se escriben una vez.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    rl = pdf_lib()
+    escritor = PdfWriter()
+    pies = []
+    for pdf, pie in partes:
+        for n, pagina in enumerate(PdfReader(io.BytesIO(pdf)).pages):
+            escritor.add_page(pagina)
+            pies.append(pie(n) if pie else None)
+
+    buf = io.BytesIO()
+    c = rl.canvas.Canvas(buf, pagesize=rl.letter)
+    for args in pies:
+        if args:
+            dibujar_pie(c, *args)
+        c.showPage()
+    c.save()
+
+    for pagina, capa, args in zip(escritor.pages, PdfReader(buf).pages, pies):
+        if args:
+            pagina.merge_page(capa)
+            pagina.compress_content_streams()   # merge_page lo deja sin comprimir
+    # Cada pasada une un nivel de referencias (máscara -> imagen -> fondo)
+    for _ in range(PDF_UNIR_PASADAS):
+        escritor.compress_identical_objects()
+
+    salida = io.BytesIO()
+    escritor.write(salida)
+    return salida.getvalue()
+
+
+def portada_rango(desde, hasta, filas, numeracion):
+    """Página de índice: una fila por día con sus misas, intenciones y páginas."""
+    rl = pdf_lib()
+    Table, TableStyle, colors = rl.Table, rl.TableStyle, rl.colors
+
+    w, h = rl.letter
+    buf = io.BytesIO()
+    c = rl.canvas.Canvas(buf, pagesize=rl.letter)
+    definir_fondo_pdf(c, w, h)
+    c.doForm(FORM_FONDO)
+
+    c.setFont("Helvetica-Bold", 11)
+    c.drawCentredString(w/2, h - 130, "INTENCIONES PARA LA SANTA MISA")
+    c.setFont("Helvetica", 9)
+    c.drawCentredString(w/2, h - 146, f"DEL {fecha_larga(desde)} AL {fecha_larga(hasta)}")
+
+    encabezado = ["DÍA", "MISAS", "INTENCIONES", "PÁGINAS"]
+    if numeracion == "continua":
+        encabezado.append("DESDE PÁG.")
+    data = [encabezado] + filas
+    t = Table(data, colWidths=None, rowHeights=[14] * len(data))
+    t.setStyle(TableStyle([
+        ("FONT", (0,0), (-1,0), "Helvetica-Bold", 8),
+        ("FONT", (0,1), (-1,-1), "Helvetica", 8),
+        ("GRID", (0,0), (-1,-1), 0.25, colors.lightgrey),
+        ("BACKGROUND", (0,0), (-1,0), colors.lightgrey),
+        ("ALIGN", (1,0), (-1,-1), "CENTER"),
+    ]))
+    w_table, h_table = t.wrapOn(c, w - 100, h)
+    t.drawOn(c, (w - w_table) / 2, h - 170 - h_table)
+
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+@tipo_trabajo("pdf_rango", "PDF de varios días")
+def trabajo_pdf_rango(trabajo_id, params, progreso):
+    desde = date.fromisoformat(params["desde"])
+    hasta = date.fromisoformat(params["hasta"])
+    numeracion = params["numeracion"]
+
+    cur = get_db().cursor()
+    dias = []
+    d = desde
+    while d <= hasta:
+        datos = datos_pdf_dia(cur, d.isoformat())
+        if datos["misas"]:
+            dias.append(datos)
+        d += timedelta(days=1)
+    cur.close()
+    if not dias:
+        raise ValueError("No hay misas en el rango seleccionado")
+
+    progreso(0, len(dias))
+    cuerpos = cuerpos_pdf_rango(dias, progreso)
+    progreso(len(dias), len(dias))
+    paginas = [contar_paginas_pdf(cuerpo) for cuerpo in cuerpos]
+    total = sum(paginas)
+
+    # === PORTADA CON ÍNDICE ===
+    filas = []
+    inicio = 1
+    for datos, n in zip(dias, paginas):
+        fila = [fecha_larga(datetime.strptime(datos["dia"], "%Y-%m-%d")),
+                len(datos["misas"]),
+                sum(len(v) for v in datos["items_por_misa"].values()),
+                n]
+        if numeracion == "continua":
+            fila.append(inicio)
+        filas.append(fila)
+        inicio += n
+
+    impreso = texto_impreso(params["usuario"])
+    partes = [(portada_rango(desde, hasta, filas, numeracion), lambda i: (impreso,))]
+
+    # === DÍAS, CON SU PIE ===
+    inicio = 0
+    for cuerpo, n in zip(cuerpos, paginas):
+        if numeracion == "continua":
+            pie = lambda i, base=inicio: (impreso, f"Página {base + i + 1} de {total}")
+        else:
+            pie = lambda i, n=n: (impreso, f"Página {i + 1} de {n}")
+        partes.append((cuerpo, pie))
+        inicio += n
+
+    with fase_pdf("union"):
+        pdf = unir_pdfs(partes)
+
+    ruta = ruta_trabajo(trabajo_id, f"intenciones_{desde}_{hasta}.pdf")
+    with open(ruta, "wb") as f:
+        f.write(pdf)
+    return ruta, f"{len(dias)} días, {total} páginas"
+
+
+@app.route("/funcionario/print_range", methods=["POST"])
+@login_required()
+def funcionario_print_range():
+    try:
+        desde = date.fromisoformat(request.form["desde"])
+        hasta = date.fromisoformat(request.form["hasta"])
+    except ValueError:
+        flash("❌ Fecha inválida.")
+        return redirect("/funcionario")
+
+    if hasta < desde:
+        flash("❌ La fecha final debe ser posterior a la inicial.")
+        return redirect("/funcionario")
+    if (hasta - desde).days + 1 > PDF_RANGO_MAX_DIAS:
+        flash(f"❌ Máximo {PDF_RANGO_MAX_DIAS} días por impresión.")
+        return redirect("/funcionario")
+
+    numeracion = request.form.get("numeracion", "continua")
+    if numeracion not in NUMERACIONES_RANGO:
+        numeracion = "continua"
+
+    return encolar_y_responder("pdf_rango", {
+        "desde": desde.isoformat(),
+        "hasta": hasta.isoformat(),
+        "numeracion": numeracion,
+        "usuario": session.get("username", "N/A"),
+    })
+
+# ============================================================
+#  MÉTRICAS
+# ============================================================
+
+@app.route("/admin/metrics")
+def admin_metrics():
+    # Sesión de administrador, o token para que Prometheus pueda leerlas
+    token = request.headers.get("Authorization", "")
+    if not (METRICS_TOKEN and token == f"Bearer {METRICS_TOKEN}"):
+        if "user_id" not in session:
+            return redirect(url_for("login"))
+        if session.get("role") != "admin":
+            return "Acceso denegado", 403
+
+    m = metricas_agregadas()
+    if request.args.get("formato") == "json":
+        return jsonify(m)
+    return Response(metricas_prometheus(m), mimetype="text/plain; version=0.0.4")
+
 # ============================================================
 #  VERIFICA AL DB
 # ============================================================
@@ -1252,7 +4125,8 @@ def admin_seed():
 
     # === 1️⃣ Crear una misa ===
     hoy = date.today().isoformat()
-    cur.execute("INSERT INTO misas (fecha, hora, ampm) VALUES (?, ?, ?)", (hoy, "11:00", "AM"))
+    cur.execute("INSERT INTO misas (fecha, hora, ampm, minutos) VALUES (?, ?, ?, ?)",
+                (hoy, "11:00", "AM", minutos_misa("11:00", "AM")))
     misa_id = cur.lastrowid
 
     # === 2️⃣ Crear categorías ===
@@ -1289,6 +4163,7 @@ def admin_seed():
         INSERT INTO settings (key, value)
         VALUES ('pdf_texto_global', 'NOS PREPARAMOS PARA LA SANTA MISA. AGRADECEMOS A TODOS COLOCAR SUS TELEFONOS EN MODO SILENCIO. AVE MARIA PURISIMA...')
     """)
+    invalidar_referencia(cur)
 
     # === 5️⃣ Intenciones ===
     intenciones = [
@@ -1435,3 +4310,9 @@ def admin_seed():
     
     if __name__ == "__main__":
         app.run(host="0.0.0.0", port=5000)   
+
+
+# ============================================================
+#  TIEMPO DE ARRANQUE
+# ============================================================
+_metricas["arranque"]["importacion"] = time.perf_counter() - _T_INICIO_IMPORTACION
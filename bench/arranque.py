@@ -0,0 +1,68 @@
+"""Mide el arranque en frío de un worker: importar app.py y atender la primera petición.
+
+Cada repetición corre en un intérprete nuevo (como un worker recién creado)
+contra una base ya inicializada.
+
+    python -m bench.arranque --repeticiones 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.rutas import percentil
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CODIGO = """
+import json, sys
+sys.path.insert(0, {app_dir!r})
+import app
+app.app.config["TESTING"] = True
+app.app.test_client().get("/login")
+arranque = app._metricas["arranque"]
+print(json.dumps({{
+    "importacion": arranque["importacion"],
+    "primera_peticion": arranque["primera_peticion"],
+    "reportlab": "reportlab" in sys.modules,
+}}))
+"""
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--repeticiones", type=int, default=10)
+    args = p.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_arranque_")
+    env = dict(os.environ,
+               INTENCIONES_DB=os.path.join(tmp, "bench.db"),
+               METRICS_DIR=os.path.join(tmp, "metrics"))
+
+    # Inicializar el esquema una vez, como haría el despliegue
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app", "init-db"],
+                   cwd=APP_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    codigo = CODIGO.format(app_dir=APP_DIR)
+    medidas = {"proceso": [], "importacion": [], "primera_peticion": []}
+    for _ in range(args.repeticiones):
+        t = time.perf_counter()
+        salida = subprocess.run([sys.executable, "-c", codigo], cwd=tmp, env=env,
+                                check=True, capture_output=True, text=True).stdout
+        medidas["proceso"].append((time.perf_counter() - t) * 1000)
+        r = json.loads(salida.splitlines()[-1])
+        medidas["importacion"].append(r["importacion"] * 1000)
+        medidas["primera_peticion"].append(r["primera_peticion"] * 1000)
+        if r["reportlab"]:
+            print("AVISO: ReportLab se cargó sin generar ningún PDF")
+
+    print(f"{'fase':20} {'p50 ms':>9} {'max ms':>9}")
+    for fase, valores in medidas.items():
+        print(f"{fase:20} {percentil(valores, 50):>9.1f} {max(valores):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Prueba de concurrencia contra gunicorn real (gthread, varios workers).
+
+Levanta gunicorn con gunicorn.conf.py sobre una base sintética y lanza varios
+funcionarios en paralelo que registran intenciones e imprimen PDF del día.
+Termina con error si alguna petición falla, si falta alguna intención o si
+el log de gunicorn muestra "database is locked".
+
+    python -m bench.concurrencia --usuarios 16 --registros 40
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+
+from bench import datos
+from bench.rutas import percentil
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Cliente:
+    def __init__(self, base):
+        self.base = base
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def pedir(self, ruta, data=None):
+        cuerpo = urllib.parse.urlencode(data).encode() if data is not None else None
+        with self.opener.open(self.base + ruta, cuerpo, timeout=120) as resp:
+            return resp.geturl(), resp.read()
+
+    def esperar_trabajo(self, url):
+        while True:
+            _, cuerpo = self.pedir(urllib.parse.urlparse(url).path + "?formato=json")
+            estado = json.loads(cuerpo)
+            if estado["estado"] == "error":
+                raise RuntimeError(f"trabajo {estado['id']}: {estado['mensaje']}")
+            if estado["estado"] == "terminado":
+                return self.pedir(estado["descarga"])[1]
+            time.sleep(0.05)
+
+
+def funcionario(n, args, base, misas, dias, tiempos, errores):
+    cli = Cliente(base)
+    rnd = random.Random(n)
+    try:
+        cli.pedir("/login", {"username": f"FUNC{n}", "password": "clave"})
+    except Exception as e:
+        errores.append(f"FUNC{n} login: {e}")
+        return
+
+    for i in range(args.registros):
+        try:
+            t = time.perf_counter()
+            cli.pedir("/funcionario/registrar", {
+                "misa_id": rnd.choice(misas),
+                "categoria_id": 2,   # SALUD: solo "ofrece"
+                "ofrece": f"CONCURRENCIA {n} {i}",
+            })
+            tiempos["registrar"].append((time.perf_counter() - t) * 1000)
+
+            if i % args.imprimir_cada == 0:
+                t = time.perf_counter()
+                url, pdf = cli.pedir("/funcionario/print_day", {"dia": rnd.choice(dias)})
+                if "/trabajos/" in url:
+                    pdf = cli.esperar_trabajo(url)
+                if not pdf.startswith(b"%PDF"):
+                    raise RuntimeError("la respuesta no es un PDF")
+                tiempos["print_day"].append((time.perf_counter() - t) * 1000)
+        except Exception as e:
+            errores.append(f"FUNC{n} #{i}: {e}")
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--usuarios", type=int, default=16, help="funcionarios en paralelo")
+    p.add_argument("--registros", type=int, default=40, help="intenciones por funcionario")
+    p.add_argument("--imprimir-cada", type=int, default=10,
+                   help="imprimir un PDF cada N registros")
+    p.add_argument("--workers", type=int, default=2)
+    p.add_argument("--hilos", type=int, default=8)
+    args = p.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_concurrencia_")
+    db = os.path.join(tmp, "bench.db")
+    inicio = date.today() + timedelta(days=1)
+    datos.generar(db, dias=7, misas=4, intenciones=40, funcionarios=args.usuarios, inicio=inicio)
+
+    with sqlite3.connect(db) as conn:
+        misas = [r[0] for r in conn.execute("SELECT id FROM misas")]
+        antes = conn.execute("SELECT COUNT(*) FROM intenciones").fetchone()[0]
+    dias = [(inicio + timedelta(days=d)).isoformat() for d in range(7)]
+
+    puerto = puerto_libre()
+    env = dict(os.environ,
+               INTENCIONES_DB=db,
+               PORT=str(puerto),
+               WEB_CONCURRENCY=str(args.workers),
+               GUNICORN_THREADS=str(args.hilos),
+               SECRET_KEY="bench",
+               PDF_CACHE_DIR=os.path.join(tmp, "pdf"),
+               TRABAJOS_DIR=os.path.join(tmp, "trabajos"),
+               METRICS_DIR=os.path.join(tmp, "metrics"),
+               PURGA_DIR=os.path.join(tmp, "archivos"))
+    log_path = os.path.join(tmp, "gunicorn.log")
+    log = open(log_path, "w")
+    servidor = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        cwd=APP_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    base = f"http://127.0.0.1:{puerto}"
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(base + "/login", timeout=1).read()
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            raise SystemExit("gunicorn no arrancó; ver " + log_path)
+
+        tiempos = {"registrar": [], "print_day": []}
+        errores = []
+        hilos = [threading.Thread(target=funcionario,
+                                  args=(n, args, base, misas, dias, tiempos, errores))
+                 for n in range(1, args.usuarios + 1)]
+        t = time.perf_counter()
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        segundos = time.perf_counter() - t
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=30)
+        log.close()
+
+    with sqlite3.connect(db) as conn:
+        registradas = conn.execute("SELECT COUNT(*) FROM intenciones").fetchone()[0] - antes
+    with open(log_path) as f:
+        texto_log = f.read()
+
+    esperadas = args.usuarios * args.registros
+    print(f"{args.usuarios} funcionarios, {args.workers} workers x {args.hilos} hilos, {segundos:.1f} s")
+    for nombre, valores in tiempos.items():
+        if valores:
+            print(f"{nombre:12} n={len(valores):5} p50={percentil(valores, 50):8.1f} ms "
+                  f"p95={percentil(valores, 95):8.1f} ms max={max(valores):8.1f} ms")
+    print(f"intenciones registradas: {registradas}/{esperadas}")
+
+    fallas = list(errores)
+    if registradas != esperadas:
+        fallas.append(f"se esperaban {esperadas} intenciones y se registraron {registradas}")
+    if "database is locked" in texto_log:
+        fallas.append("'database is locked' en el log de gunicorn")
+    if "Traceback" in texto_log:
+        fallas.append("excepciones en el log de gunicorn")
+    if fallas:
+        print("FALLAS:")
+        for f in fallas[:20]:
+            print("  " + f)
+        print("log: " + log_path)
+        sys.exit(1)
+    print("Sin errores.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Generador de bases de datos sintéticas para pruebas de rendimiento.
+
+Crea N días × M misas por día × K intenciones por misa, repartidas entre las
+mismas categorías que carga /admin/seed, más F funcionarios.
+
+    python -m bench.datos --db /tmp/bench.db --dias 365 --misas 4 --intenciones 60
+"""
+import argparse
+import os
+import random
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+
+CATEGORIAS = [
+    ("DIFUNTOS", "POR EL ALIVIO Y ETERNO DESCANSO DE:", 1),
+    ("SALUD", "POR LA SALUD DE:", 2),
+    ("ACCION DE GRACIAS", "EN ACCION DE GRACIAS POR:", 3),
+    ("VARIOS", "VARIOS", 4),
+    ("INTENCIONES", "INTENCIONES Y NECESIDADES PERSONALES DE:", 5),
+    ("PROSPERIDAD", "POR LA PROSPERIDAD DE:", 6),
+    ("CUMPLEAÑOS", "POR EL CUMPLEAÑOS DE:", 7),
+    ("TRABAJO", "POR EL TRABAJO DE:", 8),
+]
+
+# Peso relativo de cada categoría en un día normal
+PESOS = [45, 30, 8, 5, 5, 3, 2, 2]
+
+FRASES = ["ESPIRITU SANTO", "NUESTRO SEÑOR", "SEÑOR DE LOS MILAGROS",
+          "VIRGEN DE FATIMA", "SANTISIMA VIRGEN"]
+
+NOMBRES = ["JOSE", "MARIA", "ANA", "LUIS", "CARLOS", "ROSA", "PEDRO", "CLARA",
+           "JORGE", "GLORIA", "EDUARDO", "SONIA", "ALVARO", "BLANCA", "RAUL",
+           "LEONOR", "DANIEL", "FLOR", "GABRIEL", "EVA", "NIÑO", "INES"]
+APELLIDOS = ["ORJUELA", "BECERRA", "SUAREZ", "GOMEZ", "RODRIGUEZ", "PAEZ",
+             "MALAVER", "CARDONA", "VERGARA", "CORZO", "TELLEZ", "MORENO",
+             "SARMIENTO", "CASTELLANOS", "MUÑOZ", "NIÑO", "PEDREROS", "AVILA"]
+
+HORAS = [("06:00", "AM"), ("07:00", "AM"), ("09:00", "AM"), ("11:00", "AM"),
+         ("12:00", "PM"), ("05:00", "PM"), ("06:00", "PM"), ("07:00", "PM")]
+
+
+def nombre(rnd):
+    if rnd.random() < 0.2:
+        return f"FAMILIA {rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}"
+    return f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)}"
+
+
+def generar(db, dias=30, misas=4, intenciones=60, funcionarios=10,
+            inicio=None, semilla=1):
+    """Crea (o reemplaza) `db` con datos sintéticos y devuelve un resumen."""
+    for sufijo in ("", "-wal", "-shm"):
+        if os.path.exists(db + sufijo):
+            os.remove(db + sufijo)
+
+    # El esquema (con migraciones) lo crea la propia aplicación
+    os.environ["INTENCIONES_DB"] = db
+    import app as app_mod
+    app_mod.DB = db
+    app_mod.init_db()
+
+    rnd = random.Random(semilla)
+    if inicio is None:
+        inicio = date.today() - timedelta(days=dias // 2)
+
+    conn = sqlite3.connect(db)
+    cur = conn.cursor()
+
+    cur.executemany("INSERT INTO categorias(nombre, texto_adicional, orden, active) VALUES (?,?,?,1)",
+                    CATEGORIAS)
+    cur.executemany("INSERT INTO intencion_base(frase, active) VALUES (?,1)", [(f,) for f in FRASES])
+    cur.execute("INSERT OR REPLACE INTO settings(key,value) VALUES ('pdf_texto_global', ?)",
+                ("NOS PREPARAMOS PARA LA SANTA MISA. AVE MARIA PURISIMA...",))
+
+    cur.executemany("INSERT INTO users(username,password,role,active) VALUES (?,?,'funcionario',1)",
+                    [(f"FUNC{n}", "clave") for n in range(1, funcionarios + 1)])
+    cur.execute("SELECT id FROM users WHERE role='funcionario'")
+    func_ids = [r[0] for r in cur.fetchall()]
+
+    cur.execute("SELECT id FROM categorias ORDER BY orden")
+    cat_ids = [r[0] for r in cur.fetchall()]
+    cur.execute("SELECT id FROM intencion_base")
+    base_ids = [r[0] for r in cur.fetchall()]
+
+    horas = HORAS[:misas] if misas <= len(HORAS) else HORAS
+    total_int = 0
+    for d in range(dias):
+        fecha = (inicio + timedelta(days=d)).isoformat()
+        for n in range(misas):
+            hora, ampm = horas[n % len(horas)]
+            cur.execute("INSERT INTO misas(fecha,hora,ampm,minutos) VALUES (?,?,?,?)",
+                        (fecha, hora, ampm, app_mod.minutos_misa(hora, ampm)))
+            misa_id = cur.lastrowid
+
+            filas = []
+            creado = datetime.fromisoformat(fecha) - timedelta(days=7)
+            for _ in range(intenciones):
+                cat = rnd.choices(cat_ids, PESOS)[0]
+                creado += timedelta(seconds=rnd.randint(30, 600))
+                if cat in cat_ids[:2]:   # DIFUNTOS y SALUD: sin frase ni ofrece
+                    fila = (misa_id, cat, "", None, nombre(rnd))
+                else:
+                    fila = (misa_id, cat, nombre(rnd), rnd.choice(base_ids),
+                            f"POR {nombre(rnd)} Y FAMILIA")
+                filas.append(fila + (creado.isoformat(), creado.isoformat(), rnd.choice(func_ids)))
+
+            cur.executemany("""
+                INSERT INTO intenciones(misa_id, categoria_id, ofrece, intencion_base_id,
+                                        peticiones, fecha_creado, fecha_actualizado, funcionario_id)
+                VALUES (?,?,?,?,?,?,?,?)
+            """, filas)
+            total_int += len(filas)
+
+    conn.commit()
+    conn.close()
+
+    return {
+        "db": db,
+        "inicio": inicio.isoformat(),
+        "dias": dias,
+        "misas": dias * misas,
+        "intenciones": total_int,
+        "funcionarios": funcionarios,
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--db", required=True, help="ruta del archivo SQLite a crear")
+    p.add_argument("--dias", type=int, default=30)
+    p.add_argument("--misas", type=int, default=4, help="misas por día")
+    p.add_argument("--intenciones", type=int, default=60, help="intenciones por misa")
+    p.add_argument("--funcionarios", type=int, default=10)
+    p.add_argument("--inicio", type=date.fromisoformat, default=None,
+                   help="primer día (por defecto: hoy menos la mitad del rango)")
+    p.add_argument("--semilla", type=int, default=1)
+    args = p.parse_args()
+
+    t = time.perf_counter()
+    resumen = generar(args.db, args.dias, args.misas, args.intenciones,
+                      args.funcionarios, args.inicio, args.semilla)
+    resumen["segundos"] = round(time.perf_counter() - t, 2)
+    print(resumen)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Mide la importación CSV del admin: filas por segundo y pico de memoria.
+
+Genera una base sintética y CSV de varios tamaños con las columnas de la
+exportación del admin; cada archivo se sube a /admin/import_csv y se espera
+el trabajo. La memoria no debería crecer con el tamaño del archivo.
+
+    python -m bench.importar --filas 10000 100000
+"""
+import argparse
+import csv
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+from bench import datos
+
+FRASE = datos.FRASES[0]
+
+
+def escribir_csv(ruta, filas, misas, semilla=1):
+    rnd = random.Random(semilla)
+    categorias = [c[0] for c in datos.CATEGORIAS]
+    with open(ruta, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["Fecha Misa", "Hora", "AM/PM", "Categoría", "Ofrece", "Frase Base",
+                    "Peticiones", "Funcionario", "Fecha Creado", "Fecha Actualizado"])
+        for i in range(filas):
+            fecha, hora, ampm = rnd.choice(misas)
+            categoria = rnd.choices(categorias, datos.PESOS)[0]
+            normal = categoria not in ("DIFUNTOS", "SALUD")
+            w.writerow([fecha, hora, ampm, categoria, datos.nombre(rnd),
+                        FRASE if normal else "", datos.nombre(rnd) if normal else "",
+                        f"FUNC{1 + i % 10}", "", ""])
+
+
+def importar(cliente, ruta):
+    with open(ruta, "rb") as f:
+        resp = cliente.post("/admin/import_csv", data={"archivo": (f, "importar.csv")},
+                            content_type="multipart/form-data")
+    url = resp.headers["Location"]
+    while True:
+        estado = cliente.get(url + "?formato=json").get_json()
+        if estado["estado"] == "error":
+            raise RuntimeError(estado["mensaje"])
+        if estado["estado"] == "terminado":
+            return estado
+        time.sleep(0.05)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--filas", type=int, nargs="+", default=[10000, 100000])
+    p.add_argument("--dias", type=int, default=90)
+    args = p.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_importar_")
+    db = os.path.join(tmp, "bench.db")
+    datos.generar(db, dias=args.dias, misas=4, intenciones=20)
+    with sqlite3.connect(db) as conn:
+        misas = conn.execute("SELECT fecha, hora, ampm FROM misas").fetchall()
+
+    os.environ["INTENCIONES_DB"] = db
+    os.environ["TRABAJOS_DIR"] = os.path.join(tmp, "trabajos")
+    os.environ["METRICS_DIR"] = os.path.join(tmp, "metrics")
+    import app as app_mod
+    app_mod.app.config["TESTING"] = True
+    admin = app_mod.app.test_client()
+    admin.post("/login", data={"username": "admin", "password": "admin123"})
+
+    print(f"{'filas':>8} {'MB':>6} {'segundos':>9} {'filas/s':>9} {'pico KiB':>9}  resultado")
+    for filas in args.filas:
+        ruta = os.path.join(tmp, f"importar_{filas}.csv")
+        escribir_csv(ruta, filas, misas)
+        mb = os.path.getsize(ruta) / 1e6
+
+        t = time.perf_counter()
+        estado = importar(admin, ruta)
+        segundos = time.perf_counter() - t
+
+        # Segunda pasada solo para el pico de memoria (tracemalloc la hace más lenta)
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        importar(admin, ruta)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"{filas:>8} {mb:>6.1f} {segundos:>9.2f} {filas / segundos:>9.0f} "
+              f"{pico / 1024:>9.0f}  {estado['mensaje']}")
+
+
+if __name__ == "__main__":
+    main()
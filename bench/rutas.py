@@ -0,0 +1,219 @@
+"""Benchmark de las rutas principales usando el cliente de pruebas de Flask.
+
+Genera una base sintética (bench.datos), mide la latencia de cada ruta
+(p50/p95/p99) y el pico de memoria de Python, y opcionalmente guarda o
+compara contra una línea base en JSON.
+
+    python -m bench.rutas --dias 365 --misas 4 --intenciones 60 --guardar bench/baseline.json
+    python -m bench.rutas --dias 365 --misas 4 --intenciones 60 --comparar bench/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from bench import datos
+
+
+def percentil(valores, p):
+    orden = sorted(valores)
+    k = max(0, min(len(orden) - 1, round(p / 100 * len(orden) + 0.5) - 1))
+    return orden[k]
+
+
+def pedir(cliente, metodo, url, **kwargs):
+    resp = cliente.open(url, method=metodo, **kwargs)
+    for _ in resp.iter_encoded():   # consumir el streaming sin acumularlo
+        pass
+    resp.close()
+    if resp.status_code >= 400:
+        raise RuntimeError(f"{metodo} {url} -> {resp.status_code}")
+
+    # Tareas encoladas: esperar el trabajo y descargar el resultado
+    destino = resp.headers.get("Location", "")
+    if resp.status_code == 302 and "/trabajos/" in destino:
+        while True:
+            estado = cliente.get(destino + "?formato=json").get_json()
+            if estado["estado"] == "error":
+                raise RuntimeError(f"{metodo} {url} -> trabajo {estado['id']}: {estado['mensaje']}")
+            if estado["estado"] == "terminado":
+                break
+            time.sleep(0.01)
+        if estado["descarga"]:
+            return pedir(cliente, "GET", estado["descarga"])
+    return resp
+
+
+def escenarios(app_mod, admin, func, resumen):
+    inicio = date.fromisoformat(resumen["inicio"])
+    fin = inicio + timedelta(days=resumen["dias"] - 1)
+    hoy = (inicio + timedelta(days=resumen["dias"] // 2)).isoformat()
+
+    with app_mod.app.app_context():
+        cur = app_mod.get_db().cursor()
+        cur.execute("SELECT id FROM misas WHERE fecha=? ORDER BY minutos", (hoy,))
+        misa_ids = [r["id"] for r in cur.fetchall()]
+        cur.execute("SELECT id FROM categorias WHERE nombre='VARIOS'")
+        cat_varios = cur.fetchone()["id"]
+        cur.close()
+
+    rango = {"desde": inicio.isoformat(), "hasta": fin.isoformat()}
+
+    def registrar(i):
+        pedir(func, "POST", "/funcionario/registrar", data={
+            "misa_id": misa_ids[i % len(misa_ids)],
+            "categoria_id": cat_varios,
+            "ofrece": "BENCHMARK",
+            "int_base_id": 1,
+            "peticiones": f"POR LA PRUEBA {i}",
+        })
+
+    def registrar_lote(i):
+        # Una familia con 15 difuntos para la misma misa
+        pedir(func, "POST", "/funcionario/registrar_lote", data={
+            "misa_id": misa_ids[i % len(misa_ids)],
+            "categoria_id": 1,
+            "nombres": "\n".join(f"BENCHMARK {i} {n}" for n in range(15)),
+        })
+
+    def borrar_rango(i):
+        # Cada repetición borra un día más, desde el inicio del rango
+        hasta = (inicio + timedelta(days=i)).isoformat()
+        pedir(admin, "POST", "/admin/delete_range", data={"hasta": hasta})
+
+    # (nombre, función(i), ¿admite calentamiento?)
+    return [
+        ("GET /funcionario", lambda i: pedir(func, "GET", f"/funcionario?dia={hoy}"), True),
+        ("POST /funcionario/registrar", registrar, True),
+        ("POST /funcionario/registrar_lote", registrar_lote, True),
+        ("POST /funcionario/print_day",
+         lambda i: pedir(func, "POST", "/funcionario/print_day", data={"dia": hoy}), True),
+        ("POST /funcionario/export_csv",
+         lambda i: pedir(func, "POST", "/funcionario/export_csv", data=rango), True),
+        ("POST /admin/export_csv",
+         lambda i: pedir(admin, "POST", "/admin/export_csv", data=rango), True),
+        ("GET /funcionario/nombres",
+         lambda i: pedir(func, "GET", "/funcionario/nombres?campo=ofrece&q=" + "MARIA G"[:1 + i % 7]), True),
+        ("GET /buscar", lambda i: pedir(func, "GET", "/buscar?q=maria go"), True),
+        ("GET /admin", lambda i: pedir(admin, "GET", "/admin"), True),
+        ("GET /admin?section=misas", lambda i: pedir(admin, "GET", "/admin?section=misas"), True),
+        ("POST /admin/delete_range", borrar_rango, False),
+    ]
+
+
+def medir(fn, repeticiones, calentar):
+    if calentar:
+        fn(0)
+
+    tiempos = []
+    for i in range(1, repeticiones + 1):
+        t = time.perf_counter()
+        fn(i)
+        tiempos.append((time.perf_counter() - t) * 1000)
+
+    # Pico de memoria en una petición adicional (tracemalloc la hace más lenta)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fn(repeticiones + 1)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "n": len(tiempos),
+        "media_ms": round(sum(tiempos) / len(tiempos), 2),
+        "p50_ms": round(percentil(tiempos, 50), 2),
+        "p95_ms": round(percentil(tiempos, 95), 2),
+        "p99_ms": round(percentil(tiempos, 99), 2),
+        "max_ms": round(max(tiempos), 2),
+        "pico_kib": round(pico / 1024, 1),
+    }
+
+
+def comparar(resultado, base, tolerancia):
+    regresiones = []
+    for nombre, actual in resultado["rutas"].items():
+        anterior = base.get("rutas", {}).get(nombre)
+        if not anterior:
+            continue
+        for campo in ("p50_ms", "p95_ms", "pico_kib"):
+            if anterior[campo] and actual[campo] > anterior[campo] * (1 + tolerancia):
+                regresiones.append(f"{nombre}: {campo} {anterior[campo]} -> {actual[campo]}")
+    return regresiones
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--dias", type=int, default=60)
+    p.add_argument("--misas", type=int, default=4, help="misas por día")
+    p.add_argument("--intenciones", type=int, default=60, help="intenciones por misa")
+    p.add_argument("--funcionarios", type=int, default=10)
+    p.add_argument("--repeticiones", type=int, default=20)
+    p.add_argument("--sin-cache-pdf", action="store_true",
+                   help="desactiva la caché de PDF para medir la generación completa")
+    p.add_argument("--guardar", help="escribir el resultado como línea base JSON")
+    p.add_argument("--comparar", help="comparar contra una línea base JSON")
+    p.add_argument("--tolerancia", type=float, default=0.25,
+                   help="aumento relativo permitido antes de marcar regresión")
+    args = p.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_intenciones_")
+    os.environ["PDF_CACHE_DIR"] = os.path.join(tmp, "pdf")
+    os.environ["PURGA_DIR"] = os.path.join(tmp, "archivos")
+    if args.sin_cache_pdf:
+        os.environ["PDF_CACHE_MAX_MB"] = "0"
+
+    resumen = datos.generar(os.path.join(tmp, "bench.db"), args.dias, args.misas,
+                            args.intenciones, args.funcionarios)
+
+    import app as app_mod
+    app_mod.app.config["TESTING"] = True
+
+    admin = app_mod.app.test_client()
+    pedir(admin, "POST", "/login", data={"username": "admin", "password": "admin123"})
+    func = app_mod.app.test_client()
+    pedir(func, "POST", "/login", data={"username": "FUNC1", "password": "clave"})
+
+    resultado = {
+        "entorno": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "repeticiones": args.repeticiones,
+            "sin_cache_pdf": args.sin_cache_pdf,
+            "datos": resumen,
+        },
+        "rutas": {},
+    }
+
+    print(f"Datos: {resumen['misas']} misas, {resumen['intenciones']} intenciones")
+    print(f"{'ruta':32} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'pico KiB':>10}")
+    for nombre, fn, calentar in escenarios(app_mod, admin, func, resumen):
+        r = medir(fn, args.repeticiones, calentar)
+        resultado["rutas"][nombre] = r
+        print(f"{nombre:32} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} "
+              f"{r['max_ms']:>9} {r['pico_kib']:>10}")
+
+    if args.guardar:
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"Línea base guardada en {args.guardar}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        regresiones = comparar(resultado, base, args.tolerancia)
+        if regresiones:
+            print("REGRESIONES:")
+            for r in regresiones:
+                print("  " + r)
+            sys.exit(1)
+        print("Sin regresiones respecto a la línea base.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Configuración de gunicorn para intenciones (SQLite en un solo disco).
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Workers gthread: cada worker atiende varias peticiones a la vez en hilos, así
+un PDF o una exportación lenta no bloquea a los demás funcionarios. SQLite
+admite un solo escritor a la vez (WAL + busy_timeout hacen esperar a los
+demás), por eso conviene pocos procesos con varios hilos y no muchos procesos.
+
+Variables de entorno: PORT, WEB_CONCURRENCY (procesos), GUNICORN_THREADS
+(hilos por proceso), GUNICORN_PRELOAD (1 = importar la app en el maestro).
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+
+# Importar app.py una vez en el maestro: los workers nacen con Flask ya
+# cargado (copy-on-write). Es seguro porque importar app no abre la base de
+# datos ni inicia hilos; las conexiones y los hilos de trabajos se crean en
+# cada worker después del fork.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+# Las tareas pesadas van a la cola de trabajos; una petición web no debería
+# acercarse a este límite.
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# Reciclar workers de vez en cuando (memoria de ReportLab/Pillow)
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = "-"
+
+
+def on_starting(server):
+    # Esquema y migraciones una sola vez por arranque, en el maestro
+    import app
+
+    app.init_db()
+    # No dejar una conexión abierta que los workers hereden en el fork
+    app.cerrar_conexion_del_hilo()